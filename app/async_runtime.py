@@ -0,0 +1,90 @@
+import asyncio
+import signal
+import time
+import logging
+from typing import Awaitable, Callable, Dict
+from app.core import Application
+from app_utils.metrics import REGISTRY
+
+TASK_RESTARTS = REGISTRY.counter("facp_task_restarts_total", "Supervised tasks restarted after failing or returning", ["task"])
+
+class TaskSupervisor:
+    def __init__(self, min_restart_delay: float = 1, max_restart_delay: float = 60, healthy_after: float = 60):
+        self.min_restart_delay = min_restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.healthy_after = healthy_after
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def start(self, name: str, factory: Callable[[], Awaitable[None]]):
+        self.tasks[name] = asyncio.create_task(self._supervise(name, factory), name=name)
+        self.logger.info(f"Started task: {name}")
+
+    async def _supervise(self, name: str, factory: Callable[[], Awaitable[None]]):
+        delay = self.min_restart_delay
+        while True:
+            started = time.monotonic()
+            try:
+                await factory()
+                self.logger.error(f"Task {name} returned unexpectedly. Restarting in {delay} seconds.")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.exception(f"Task {name} has died: {e}. Restarting in {delay} seconds.")
+            TASK_RESTARTS.labels(name).inc()
+            if time.monotonic() - started >= self.healthy_after:
+                delay = self.min_restart_delay
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+
+    async def stop_all(self):
+        for name, task in self.tasks.items():
+            self.logger.info(f"Stopping task: {name}")
+            task.cancel()
+        # Tasks are stopped together and awaited, so every finally block has run when this returns
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks.clear()
+
+class AsyncApplication(Application):
+    # Runs the same components as Application, as supervised tasks on one event loop instead of OS threads
+    def start(self):
+        self.logger.info("Starting application (asyncio runtime)...")
+        self.queue_manager.load_queue()
+        self.serial_handlers = self._create_serial_handlers()
+        try:
+            asyncio.run(self._run())
+        except KeyboardInterrupt:
+            self.logger.info("Program terminated by user")
+        finally:
+            self.shutdown()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+        queue_ready = asyncio.Event()
+        wake_drain = lambda: loop.call_soon_threadsafe(queue_ready.set)
+        self.queue.put_listeners.append(wake_drain)
+        self.mqtt_handler.start(drain_thread=False)
+        self.metrics_server.start()
+
+        supervisor = TaskSupervisor()
+        supervisor.start("process_queue", lambda: self.mqtt_handler.process_queue_async(queue_ready))
+        supervisor.start("sync_journal", self.queue_manager.sync_journal_async)
+        supervisor.start("monitor_relays", self.relay_monitor.monitor_relays_async)
+        supervisor.start("relay_control", self.relay_controller.relay_control_async)
+        if self.config.metrics.telemetry_interval > 0:
+            supervisor.start("publish_metrics", self.metrics_server.publish_metrics_async)
+        for handler in self.serial_handlers:
+            # Every port is one task on the same loop, extra panels cost no threads
+            supervisor.start(self._serial_task_name(handler, "listening_to_serial"), handler.listening_to_serial_async)
+        try:
+            await stop.wait()
+            self.logger.info("Shutdown signal received")
+        finally:
+            await supervisor.stop_all()
+            self.queue.put_listeners.remove(wake_drain)
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(signum)
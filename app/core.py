@@ -1,61 +1,97 @@
 import logging
+from typing import List
 from config.loader import ConfigSchema
+from config.schema import PanelConfig
 from classes.mqtt_sender import MqttHandler
 from classes.specific_serial_handler import Edwards_iO1000, Edwards_EST3x, Notifier_NFS, Simplex
 from app_utils.queue_operations import SafeQueue
 from components.update_app import update_check_thread
 from components.relay_controller import RelayController
+from components.gpio_backend import create_gpio_backend
 from components.queue_manager import QueueManager
 from components.thread_manager import ThreadManager
+from components.metrics_server import MetricsServer
+from app_utils.metrics import REGISTRY
+from logging_setup import dropped_records
 from classes.relay_monitor import RelayMonitor
 from classes.serial_port_handler import SerialPortHandler
 
+PANEL_HANDLERS = {
+    10001: Edwards_iO1000,
+    10002: Edwards_EST3x,
+    10003: Notifier_NFS,
+    10004: Simplex
+}
+
+def create_serial_handler(config: ConfigSchema, event_severity_levels: dict, queue: SafeQueue, panel: PanelConfig) -> SerialPortHandler:
+    severity_list = event_severity_levels.get(panel.id_modelo_panel, {})
+    
+    handler_class = PANEL_HANDLERS.get(panel.id_modelo_panel)
+    if not handler_class:
+        raise ValueError(f"Unsupported panel model: {panel.id_modelo_panel}")
+    
+    severity_rules = (event_severity_levels.get("rules") or {}).get(panel.id_modelo_panel)
+    # Each handler sees its own panel as the serial configuration
+    panel_config = config.model_copy(update={"serial": panel.serial, "id_modelo_panel": panel.id_modelo_panel})
+    handler = handler_class(panel_config, severity_list, queue, severity_rules)
+    handler.device_name = panel.device_name
+    return handler
+
 class Application:
     def __init__(self, config: ConfigSchema, event_severity_levels: dict):
         self.config = config
         self.event_severity_levels = event_severity_levels
-        self.queue = SafeQueue()
+        self.queue = SafeQueue(
+            max_bytes=config.queue.max_bytes,
+            overflow_policy=config.queue.overflow_policy,
+            spill_path=config.queue.spill_path
+        )
         self.mqtt_handler = MqttHandler(self.config, self.queue)
-        self.id_modelo_panel: int = self.config.id_modelo_panel
-        self.serial_handler: SerialPortHandler = None
+        self.serial_handlers: List[SerialPortHandler] = []
 
-        self.queue_manager = QueueManager(self.queue, "queue_backup.pkl")
-        self.relay_controller = RelayController(config.relay)
-        self.relay_monitor = RelayMonitor(config, self.mqtt_handler)
+        self.queue_manager = QueueManager(self.queue, "queue_journal", backup_path="queue_backup.pkl")
+        self.gpio = create_gpio_backend(config.gpio)
+        self.relay_controller = RelayController(config.relay, self.gpio)
+        self.relay_monitor = RelayMonitor(config, self.mqtt_handler, self.gpio)
         self.thread_manager = ThreadManager()
+        self.metrics_server = MetricsServer(config.metrics, REGISTRY, self.mqtt_handler)
+        self.queue.register_metrics(REGISTRY)
+        self.mqtt_handler.register_metrics(REGISTRY)
+        self.thread_manager.register_metrics(REGISTRY)
+        REGISTRY.counter("facp_log_records_dropped_total", "Log records dropped because the log queue was full").set_function(dropped_records)
 
         self.logger = logging.getLogger(__name__)
 
-    def _create_serial_handler(self):
-        severity_list = self.event_severity_levels.get(self.id_modelo_panel, {})
-        
-        handlers = {
-            10001: Edwards_iO1000,
-            10002: Edwards_EST3x,
-            10003: Notifier_NFS,
-            10004: Simplex
-        }
-        
-        handler_class = handlers.get(self.id_modelo_panel)
-        if not handler_class:
-            raise ValueError(f"Unsupported panel model: {self.id_modelo_panel}")
-        
-        return handler_class(self.config, severity_list, self.queue)
+    def _create_serial_handler(self, panel: PanelConfig) -> SerialPortHandler:
+        return create_serial_handler(self.config, self.event_severity_levels, self.queue, panel)
+
+    def _create_serial_handlers(self) -> List[SerialPortHandler]:
+        return [self._create_serial_handler(panel) for panel in self.config.panel_configs()]
+
+    def _serial_task_name(self, handler: SerialPortHandler, base_name: str) -> str:
+        return f"{base_name}[{handler.device_name}]" if handler.device_name else base_name
 
     def start(self):
         self.logger.info("Starting application...")
         self.queue_manager.load_queue()
         self.mqtt_handler.start()
+        self.metrics_server.start()
         
-        self.serial_handler = self._create_serial_handler()
+        self.serial_handlers = self._create_serial_handlers()
         
         threads = [
-            self.queue_manager.save_queue_periodically,
+            self.queue_manager.sync_journal_periodically,
             self.relay_monitor.monitor_relays,
-            self.relay_controller.relay_control,
-            self.serial_handler.listening_to_serial
+            self.relay_controller.relay_control
         ]
+        if self.config.metrics.telemetry_interval > 0:
+            threads.append(self.metrics_server.publish_metrics)
+        for handler in self.serial_handlers:
+            thread_name = self._serial_task_name(handler, handler.listening_to_serial.__name__)
+            threads.append((thread_name, handler.listening_to_serial))
+            self.thread_manager.register_wakeup(thread_name, handler.wakeup)
 
+        self.thread_manager.register_wakeup(self.relay_monitor.monitor_relays.__name__, self.relay_monitor.wakeup)
         self.thread_manager.start_threads(threads)
 
         try:
@@ -68,8 +104,10 @@ class Application:
     def shutdown(self):
         self.logger.info("Initiating graceful shutdown...")
         self.thread_manager.stop_all_threads()
-        self.queue_manager.save_queue()
+        self.metrics_server.stop()
+        # Unconfirmed publishes go back to the queue before it is persisted
+        self.mqtt_handler.stop()
+        self.queue_manager.close()
         self.relay_controller.cleanup()
         self.relay_monitor.cleanup()
-        self.mqtt_handler.stop()
         self.logger.info("Graceful shutdown completed")
\ No newline at end of file
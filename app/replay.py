@@ -0,0 +1,103 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List
+from app.core import PANEL_HANDLERS, create_serial_handler
+from app_utils.queue_operations import SafeQueue
+from app_utils.serial_capture import read_capture
+from app_utils.virtual_serial import VirtualSerial
+from classes.enums import PublishType
+from classes.serial_port_handler import SerialPortHandler
+from config.schema import ConfigSchema, PanelConfig, SerialConfig
+
+logger = logging.getLogger(__name__)
+
+def panel_model(panel: str) -> int:
+    # Accepts a model id (10002) or a handler class name (Edwards_EST3x)
+    if panel.isdigit() and int(panel) in PANEL_HANDLERS:
+        return int(panel)
+    for model, handler_class in PANEL_HANDLERS.items():
+        if handler_class.__name__ == panel:
+            return model
+    choices = ", ".join(f"{model} ({handler_class.__name__})" for model, handler_class in PANEL_HANDLERS.items())
+    raise ValueError(f"Unknown panel {panel}, expected one of: {choices}")
+
+def replay_capture(config: ConfigSchema, event_severity_levels: dict, capture_paths: List[str], model: int,
+                   speed: float = 1.0, show_events: bool = False) -> Dict[str, Any]:
+    # Feeds a capture through the panel handler over a virtual serial device. Queued messages are only
+    # counted (and printed with show_events), nothing is published. speed 0 replays as fast as possible.
+    outgoing = SafeQueue()
+    panel = PanelConfig(id_modelo_panel=model, serial=SerialConfig(puerto="replay"))
+    handler = create_serial_handler(config, event_severity_levels, outgoing, panel)
+    device = VirtualSerial("replay")
+    handler.ser = device
+    handler._register_selector()
+
+    shutdown_flag = threading.Event()
+    drained = threading.Event()
+    counts = {publish_type.name: 0 for publish_type in PublishType}
+    reader = threading.Thread(target=_read, args=(handler, shutdown_flag), name="replay_reader", daemon=True)
+    consumer = threading.Thread(target=_consume, args=(outgoing, counts, show_events, drained), name="replay_consumer", daemon=True)
+    reader.start()
+    consumer.start()
+
+    reads = 0
+    total_bytes = 0
+    offset = 0.0
+    started = time.monotonic()
+    try:
+        for offset, data in read_capture(capture_paths):
+            if speed > 0:
+                delay = started + offset / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            device.feed(data)
+            reads += 1
+            total_bytes += len(data)
+
+        # Let the reader drain the device, the idle wait below only flushes a trailing partial frame
+        while device.in_waiting:
+            time.sleep(0.01)
+        elapsed = time.monotonic() - started
+        time.sleep(handler.framing_rules.partial_line_timeout + 0.5)
+    finally:
+        shutdown_flag.set()
+        handler.wakeup()
+        reader.join(timeout=5)
+        handler.queue_events(handler.coalescer.flush())
+        handler.finish_report()
+        # Everything is queued by now, the consumer stops once the queue is empty
+        drained.set()
+        consumer.join(timeout=5)
+        handler.close_wakeup_pipe()
+        device.close()
+
+    return {
+        "reads": reads,
+        "bytes": total_bytes,
+        "capture_s": offset,
+        "replay_s": elapsed,
+        "events": counts[PublishType.TELEMETRY.name],
+        "report_chunks": counts[PublishType.REPORT.name],
+        "events_per_s": counts[PublishType.TELEMETRY.name] / elapsed if elapsed else 0.0,
+    }
+
+def _read(handler: SerialPortHandler, shutdown_flag: threading.Event) -> None:
+    try:
+        handler.process_incoming_data(shutdown_flag)
+    except Exception as e:
+        logger.error(f"Replay reader stopped: {e}")
+
+def _consume(outgoing: SafeQueue, counts: Dict[str, int], show_events: bool, drained: threading.Event) -> None:
+    while True:
+        try:
+            publish_type, message = outgoing.get(timeout=0.2)
+        except queue.Empty:
+            if drained.is_set():
+                return
+            continue
+        counts[publish_type.name] += 1
+        if show_events:
+            shown = message.to_telemetry() if hasattr(message, "to_telemetry") else message
+            print(f"{publish_type.name:<9} {shown}")
@@ -1,6 +1,20 @@
 import os
+import sys
 import pickle
-from typing import Any
+import struct
+import zlib
+import logging
+from typing import Any, Iterable, Iterator, List
+from app_utils.item_codec import encode_item, decode_item
+
+logger = logging.getLogger(__name__)
+
+QUEUE_FILE_MAGIC = b'FACPQ'
+QUEUE_FILE_VERSION = 1
+# magic, format version
+_FILE_HEADER = struct.Struct('<5sB')
+# payload length, crc32 of the payload
+_RECORD_HEADER = struct.Struct('<II')
 
 def resource_path(relative_path: str) -> str:
     try:
@@ -9,10 +23,63 @@ def resource_path(relative_path: str) -> str:
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
-def save_to_file(data: Any, file_path: str) -> None:
-    with open(file_path, 'wb') as file:
-        pickle.dump(data, file)
+def save_to_file(items: Iterable[Any], file_path: str) -> int:
+    # Written next to the target and renamed over it, a crash leaves either the old or the new file
+    tmp_path = f"{file_path}.tmp"
+    count = 0
+    try:
+        with open(tmp_path, 'wb') as file:
+            file.write(_FILE_HEADER.pack(QUEUE_FILE_MAGIC, QUEUE_FILE_VERSION))
+            for item in items:
+                payload = encode_item(item)
+                file.write(_RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+                count += 1
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    directory = os.open(os.path.dirname(os.path.abspath(file_path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+    return count
 
-def load_from_file(file_path: str) -> Any:
+def iter_file(file_path: str) -> Iterator[Any]:
     with open(file_path, 'rb') as file:
-        return pickle.load(file)
\ No newline at end of file
+        header = file.read(_FILE_HEADER.size)
+        if len(header) < _FILE_HEADER.size or header[:len(QUEUE_FILE_MAGIC)] != QUEUE_FILE_MAGIC:
+            # Files written by older versions are a single pickled list
+            file.seek(0)
+            items = pickle.load(file)
+            if not isinstance(items, list):
+                raise TypeError("Loaded data is not a list")
+            yield from items
+            return
+        _, version = _FILE_HEADER.unpack(header)
+        if version != QUEUE_FILE_VERSION:
+            raise ValueError(f"Unsupported queue file version {version} in {file_path}")
+        while True:
+            record_header = file.read(_RECORD_HEADER.size)
+            if not record_header:
+                return
+            if len(record_header) < _RECORD_HEADER.size:
+                logger.warning(f"Truncated record header at the end of {file_path}, ignoring the tail")
+                return
+            length, crc = _RECORD_HEADER.unpack(record_header)
+            payload = file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                logger.warning(f"Corrupted record at the end of {file_path}, ignoring the tail")
+                return
+            try:
+                item = decode_item(payload)
+            except Exception as e:
+                logger.error(f"Discarding unreadable record in {file_path}: {e}")
+                continue
+            yield item
+
+def load_from_file(file_path: str) -> List[Any]:
+    return list(iter_file(file_path))
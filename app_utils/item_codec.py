@@ -0,0 +1,18 @@
+import pickle
+from typing import Any
+from classes.enums import PublishType
+from classes.event_record import EventRecord
+
+# Queue items holding an EventRecord are written as this tag, the publish type and the record bytes.
+# Anything else is pickled, pickle payloads start with 0x80 so journals written before keep loading.
+EVENT_RECORD_TAG = 0x01
+
+def encode_item(item: Any) -> bytes:
+    if isinstance(item, tuple) and len(item) == 2 and isinstance(item[1], EventRecord):
+        return bytes((EVENT_RECORD_TAG, item[0].value)) + item[1].to_bytes()
+    return pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+
+def decode_item(payload: bytes) -> Any:
+    if payload[:1] == bytes((EVENT_RECORD_TAG,)):
+        return PublishType(payload[1]), EventRecord.from_bytes(payload[2:])
+    return pickle.loads(payload)
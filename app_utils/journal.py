@@ -0,0 +1,279 @@
+import os
+import struct
+import zlib
+import bisect
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Iterator, List, Set, Tuple
+from app_utils.item_codec import encode_item, decode_item
+
+logger = logging.getLogger(__name__)
+
+RECORD_PUT = 1
+RECORD_ACK = 2
+
+# kind, offset, payload length, crc32 of the payload
+_HEADER = struct.Struct('<BQII')
+SEGMENT_SUFFIX = '.seg'
+# Records are written under the queue mutex, so they only go to this buffer there. sync() flushes it and fsyncs
+WRITE_BUFFER_SIZE = 64 * 1024
+_COMPACT_TMP = 'compact.tmp'
+
+@dataclass
+class _Segment:
+    path: str
+    first_offset: int
+    puts: int = 0
+    live: int = 0
+    size: int = 0
+
+class QueueJournal:
+    def __init__(self, directory: str, segment_max_bytes: int = 4 * 1024 * 1024, fsync_batch_size: int = 64):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_batch_size = fsync_batch_size
+        self.lock = threading.Lock()
+        self.pending_sync = threading.Event()
+        self._segments: List[_Segment] = []
+        self._first_offsets: List[int] = []
+        self._live: Set[int] = set()
+        self._next_offset = 0
+        self._unsynced = 0
+        self._compacting = False
+        self._active: BinaryIO | None = None
+
+    def open(self) -> int:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, _COMPACT_TMP)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        acked: Set[int] = set()
+        puts_by_segment: List[Set[int]] = []
+        for path, first_offset in self._list_segment_files():
+            segment = _Segment(path, first_offset, size=os.path.getsize(path))
+            put_offsets: Set[int] = set()
+            for kind, offset, _ in self._read_records(path, with_payload=False):
+                if kind == RECORD_PUT:
+                    put_offsets.add(offset)
+                else:
+                    acked.add(offset)
+                self._next_offset = max(self._next_offset, offset + 1)
+            self._segments.append(segment)
+            puts_by_segment.append(put_offsets)
+
+        for segment, put_offsets in zip(self._segments, puts_by_segment):
+            live = put_offsets - acked
+            segment.puts = len(put_offsets)
+            segment.live = len(live)
+            self._live.update(live)
+        self._first_offsets = [segment.first_offset for segment in self._segments]
+
+        self._start_segment()
+        return len(self._live)
+
+    def replay(self) -> Iterator[Tuple[int, Any]]:
+        with self.lock:
+            sealed = [segment.path for segment in self._segments[:-1]]
+            live = set(self._live)
+        for path in sealed:
+            for kind, offset, payload in self._read_records(path, with_payload=True):
+                if kind != RECORD_PUT or offset not in live:
+                    continue
+                try:
+                    yield offset, decode_item(payload)
+                except Exception as e:
+                    logger.error(f"Discarding unreadable journal record {offset}: {e}")
+                    self.ack(offset)
+
+    def append(self, item: Any, payload: bytes | None = None) -> int:
+        if payload is None:
+            payload = encode_item(item)
+        with self.lock:
+            offset = self._next_offset
+            self._write(RECORD_PUT, offset, payload)
+            self._next_offset += 1
+            self._live.add(offset)
+            segment = self._segments[-1]
+            segment.puts += 1
+            segment.live += 1
+            if segment.size >= self.segment_max_bytes:
+                self._roll_segment()
+            return offset
+
+    def ack(self, offset: int) -> None:
+        with self.lock:
+            if offset not in self._live:
+                return
+            self._live.discard(offset)
+            self._write(RECORD_ACK, offset, b'')
+            index = bisect.bisect_right(self._first_offsets, offset) - 1
+            if index >= 0:
+                self._segments[index].live -= 1
+            self._drop_acked_head_segments()
+
+    def wait_for_pending(self, timeout: float) -> bool:
+        return self.pending_sync.wait(timeout)
+
+    def sync(self) -> None:
+        with self.lock:
+            if self._active is None or self._unsynced == 0:
+                self.pending_sync.clear()
+                return
+            self._unsynced = 0
+            self.pending_sync.clear()
+            self._active.flush()
+            fd = os.dup(self._active.fileno())
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def compact(self) -> None:
+        with self.lock:
+            sealed = list(self._segments[:-1])
+            if not sealed:
+                return
+            puts = sum(segment.puts for segment in sealed)
+            live_count = sum(segment.live for segment in sealed)
+            if puts and (puts - live_count) * 2 < puts:
+                return
+            live = set(self._live)
+            self._compacting = True
+
+        try:
+            kept, size = self._rewrite_live_records(sealed, live)
+        finally:
+            with self.lock:
+                self._compacting = False
+
+        with self.lock:
+            count = len(sealed)
+            if kept:
+                merged = _Segment(sealed[0].path, sealed[0].first_offset, puts=len(kept), size=size)
+                merged.live = sum(1 for offset in kept if offset in self._live)
+                self._segments[:count] = [merged]
+            else:
+                del self._segments[:count]
+            self._first_offsets = [segment.first_offset for segment in self._segments]
+            self._drop_acked_head_segments()
+        logger.debug(f"Journal compacted: {puts} records in {len(sealed)} segments reduced to {len(kept)}")
+
+    def _rewrite_live_records(self, sealed: List[_Segment], live: Set[int]) -> Tuple[List[int], int]:
+        tmp_path = os.path.join(self.directory, _COMPACT_TMP)
+        kept: List[int] = []
+        size = 0
+        with open(tmp_path, 'wb') as tmp:
+            for segment in sealed:
+                for kind, offset, payload in self._read_records(segment.path, with_payload=True):
+                    if kind == RECORD_PUT and offset in live:
+                        record = _HEADER.pack(kind, offset, len(payload), zlib.crc32(payload)) + payload
+                        tmp.write(record)
+                        size += len(record)
+                        kept.append(offset)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+
+        if kept:
+            os.replace(tmp_path, sealed[0].path)
+            obsolete = sealed[1:]
+        else:
+            os.remove(tmp_path)
+            obsolete = sealed
+        for segment in obsolete:
+            os.remove(segment.path)
+        self._fsync_directory()
+        return kept, size
+
+    def pending_count(self) -> int:
+        with self.lock:
+            return len(self._live)
+
+    def close(self) -> None:
+        self.sync()
+        with self.lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+
+    def _write(self, kind: int, offset: int, payload: bytes) -> None:
+        record = _HEADER.pack(kind, offset, len(payload), zlib.crc32(payload)) + payload
+        self._active.write(record)
+        self._segments[-1].size += len(record)
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_batch_size:
+            self.pending_sync.set()
+
+    def _start_segment(self) -> None:
+        path = os.path.join(self.directory, f"{self._next_offset:020d}{SEGMENT_SUFFIX}")
+        if self._segments and self._segments[-1].path == path:
+            # The previous segment holds no records yet, keep appending to it.
+            segment = self._segments.pop()
+            self._first_offsets.pop()
+        else:
+            segment = _Segment(path, self._next_offset)
+        self._active = open(path, 'ab', buffering=WRITE_BUFFER_SIZE)
+        segment.size = self._active.tell()
+        self._segments.append(segment)
+        self._first_offsets.append(segment.first_offset)
+        self._fsync_directory()
+
+    def _roll_segment(self) -> None:
+        self._active.flush()
+        os.fsync(self._active.fileno())
+        self._active.close()
+        self._unsynced = 0
+        self._start_segment()
+
+    def _drop_acked_head_segments(self) -> None:
+        # Acks always follow their puts, so a fully acked head segment can go
+        # without resurrecting anything recorded in the later segments.
+        while not self._compacting and len(self._segments) > 1 and self._segments[0].live == 0:
+            segment = self._segments.pop(0)
+            self._first_offsets.pop(0)
+            try:
+                os.remove(segment.path)
+            except OSError as e:
+                logger.error(f"Error removing journal segment {segment.path}: {e}")
+
+    def _list_segment_files(self) -> List[Tuple[str, int]]:
+        segments = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SEGMENT_SUFFIX):
+                continue
+            try:
+                first_offset = int(name[:-len(SEGMENT_SUFFIX)])
+            except ValueError:
+                logger.warning(f"Ignoring unexpected file in journal directory: {name}")
+                continue
+            segments.append((os.path.join(self.directory, name), first_offset))
+        return sorted(segments, key=lambda segment: segment[1])
+
+    def _read_records(self, path: str, with_payload: bool) -> Iterator[Tuple[int, int, bytes]]:
+        with open(path, 'rb') as file:
+            while True:
+                header = file.read(_HEADER.size)
+                if not header:
+                    return
+                if len(header) < _HEADER.size:
+                    logger.warning(f"Truncated record header at the end of {path}, ignoring the tail")
+                    return
+                kind, offset, length, crc = _HEADER.unpack(header)
+                payload = file.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc or kind not in (RECORD_PUT, RECORD_ACK):
+                    logger.warning(f"Corrupted record at the end of {path}, ignoring the tail")
+                    return
+                yield kind, offset, payload if with_payload else b''
+
+    def _fsync_directory(self) -> None:
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
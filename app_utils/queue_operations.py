@@ -1,29 +1,324 @@
 import queue
 import logging
-from typing import Any, List
+import heapq
+import itertools
+from collections import deque
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+from app_utils.journal import QueueJournal
+from app_utils.item_codec import encode_item, decode_item
+from app_utils.spill import SpillFile
+from app_utils.metrics import REGISTRY, MetricsRegistry
+from classes.enums import PublishType, SeverityLevel
 
 logger = logging.getLogger(__name__)
 
+# Severe alarms are always drained first, the other lanes share the sender by weight
+PRIORITY_LANE = SeverityLevel.SEVERO.value
+OTHER_LANE = 0
+LANE_WEIGHTS: Dict[int, int] = {
+    SeverityLevel.MEDIO.value: 4,
+    SeverityLevel.NOTIFICACION.value: 2,
+    OTHER_LANE: 1,
+}
+# Lanes that may be dropped, coalesced or spilled when over budget, lowest severity first
+EVICTABLE_LANES = sorted(LANE_WEIGHTS)
+
+# Message key naming the ThingsBoard device a queued message belongs to in gateway mode
+DEVICE_KEY = "device"
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_COALESCE = "coalesce"
+OVERFLOW_SPILL = "spill"
+
+QUEUE_PUTS = REGISTRY.counter("facp_queue_puts_total", "Items added to the outgoing queue").labels()
+QUEUE_GETS = REGISTRY.counter("facp_queue_gets_total", "Items taken from the outgoing queue by the sender").labels()
+
 class SafeQueue(queue.Queue):
-    def __init__(self, maxsize: int = 0):
+    def __init__(self, maxsize: int = 0, max_bytes: int = 0, overflow_policy: str = OVERFLOW_DROP_OLDEST,
+                 spill_path: str = "queue_spill.bin"):
         super().__init__(maxsize)
         self.is_serial_connected = False
+        self.journal: QueueJournal | None = None
+        self.max_bytes = max_bytes
+        self.overflow_policy = overflow_policy
+        self.spill = SpillFile(spill_path) if overflow_policy == OVERFLOW_SPILL else None
+        self.overflow_stats: Dict[str, int] = {"dropped": 0, "coalesced": 0, "spilled": 0, "unspilled": 0}
+        # Lane entries are [journal offset, item, encoded size, ticket] lists so coalescing can update them in
+        # place. The ticket numbers entries in the order they were queued and names a taken item until it is
+        # acked or requeued, journaled or not
+        self._tickets = itertools.count()
+        self._in_flight: Dict[int, List[Any]] = {}
+        self._coalesce_index: Dict[Hashable, List[Any]] = {}
+        # Called after every put, e.g. to wake an event loop that drains the queue
+        self.put_listeners: List[Callable[[], None]] = []
+
+    def attach_journal(self, journal: QueueJournal) -> None:
+        with self.mutex:
+            self.journal = journal
+
+    def restore(self, entries: Iterable[Tuple[int, Any]]) -> int:
+        count = 0
+        with self.not_full:
+            for offset, item in entries:
+                payload = encode_item(item) if self.max_bytes else b""
+                self._append(offset, item, payload)
+                self.unfinished_tasks += 1
+                count += 1
+            if self.max_bytes:
+                self._enforce_budget()
+            self.not_empty.notify_all()
+        return count
+
+    def take(self, block: bool = True, timeout: float | None = None) -> Tuple[int, Any]:
+        # Returns (ticket, item). The item stays in flight until its ticket is passed to ack or requeue
+        return super().get(block, timeout)
+
+    def get(self, block: bool = True, timeout: float | None = None) -> Any:
+        # A plain get hands the item over for good
+        ticket, item = self.take(block, timeout)
+        self.ack(ticket)
+        return item
+
+    def ack(self, ticket: int) -> None:
+        with self.mutex:
+            entry = self._in_flight.pop(ticket, None)
+        if entry is not None and entry[0] is not None and self.journal is not None:
+            self.journal.ack(entry[0])
+
+    def requeue(self, tickets: List[int]) -> None:
+        # Puts taken items back in front of their lanes, e.g. when the broker never confirmed them.
+        # Their journal entries are still pending, so nothing is appended again
+        with self.not_full:
+            for ticket in reversed(tickets):
+                entry = self._in_flight.pop(ticket, None)
+                if entry is not None:
+                    self._insert(entry, front=True)
+            if self.max_bytes:
+                self._enforce_budget()
+            self.not_empty.notify_all()
+            for listener in self.put_listeners:
+                listener()
+
+    def register_metrics(self, registry: MetricsRegistry) -> None:
+        # Sampled when metrics are collected, nothing is added to put/get for these
+        registry.gauge("facp_queue_depth", "Items waiting in the outgoing queue, spilled items included").set_function(self.qsize)
+        registry.gauge("facp_queue_memory_bytes", "Serialized size of the items held in memory").set_function(lambda: self._bytes)
+        registry.gauge("facp_queue_spilled", "Items currently spilled to disk").set_function(self.spilled_count)
+        lane_depth = registry.gauge("facp_queue_lane_depth", "Items waiting per severity lane", ["lane"])
+        for lane in self.lanes:
+            lane_depth.labels(lane).set_function(lambda lane=lane: len(self.lanes[lane]))
+        overflow = registry.counter("facp_queue_overflow_total", "Items dropped, coalesced, spilled or unspilled over the memory budget", ["action"])
+        for action in self.overflow_stats:
+            overflow.labels(action).set_function(lambda action=action: self.overflow_stats[action])
+
+    def snapshot(self) -> List[Any]:
+        # Everything not acked yet, spilled and taken items included, in the order it was queued
+        with self.mutex:
+            entries = [(entry[3], entry[1]) for lane in self.lanes.values() for entry in lane]
+            entries.extend((entry[3], entry[1]) for entry in self._in_flight.values())
+            for spilled in self._spilled.values():
+                for ticket, position, _ in spilled:
+                    record = self.spill.peek(position)
+                    if record is None:
+                        continue
+                    try:
+                        entries.append((ticket, decode_item(record[2])))
+                    except Exception as e:
+                        logger.error(f"Leaving an unreadable spilled item out of the snapshot: {e}")
+        entries.sort(key=lambda entry: entry[0])
+        return [item for _, item in entries]
+
+    def close(self) -> None:
+        # Spilled items are still in the journal (or in the backup file written before this)
+        with self.mutex:
+            if self.spill is not None:
+                self.spill.close()
+
+    def lane_depths(self) -> Dict[int, int]:
+        with self.mutex:
+            return {lane: len(entries) for lane, entries in self.lanes.items()}
 
-    def save_to_file(self, file_path: str) -> None:
-        from app_utils.file_operations import save_to_file
+    def memory_usage(self) -> int:
         with self.mutex:
-            save_to_file(list(self.queue), file_path)
+            return self._bytes
 
-    def load_from_file(self, file_path: str) -> None:
-        from app_utils.file_operations import load_from_file
+    def spilled_count(self) -> int:
         with self.mutex:
+            return self.spill.count if self.spill else 0
+
+    def lane_of(self, item: Any) -> int:
+        try:
+            severity = item[1].get("severity")
+        except (AttributeError, IndexError, TypeError):
+            return OTHER_LANE
+        return severity if severity in self.lanes else OTHER_LANE
+
+    def _init(self, maxsize: int) -> None:
+        self.lanes: Dict[int, deque] = {lane: deque() for lane in (PRIORITY_LANE, *LANE_WEIGHTS)}
+        # Per lane heap of (ticket, spill file position, journal offset) of the entries spilled to disk
+        self._spilled: Dict[int, List[Tuple[int, int, int | None]]] = {lane: [] for lane in self.lanes}
+        self._credits = dict(LANE_WEIGHTS)
+        self._size = 0
+        self._bytes = 0
+
+    def _qsize(self) -> int:
+        return self._size + (self.spill.count if self.spill else 0)
+
+    def _put(self, item: Any) -> None:
+        payload = None
+        if self.journal is not None or self.max_bytes:
+            payload = encode_item(item)
+
+        if self.max_bytes and self._bytes + len(payload) > self.max_bytes:
+            if self._coalesce(item):
+                self.unfinished_tasks -= 1
+                self._enforce_budget()
+                return
+
+        offset = None
+        if self.journal is not None:
+            try:
+                offset = self.journal.append(item, payload)
+            except Exception as e:
+                logger.error(f"Error appending item to the queue journal, keeping it in memory only: {e}")
+        self._append(offset, item, payload or b"")
+        QUEUE_PUTS.inc()
+        if self.max_bytes:
+            self._enforce_budget()
+        for listener in self.put_listeners:
+            listener()
+
+    def _append(self, offset: int | None, item: Any, payload: bytes) -> None:
+        self._insert([offset, item, len(payload), next(self._tickets)])
+
+    def _insert(self, entry: List[Any], front: bool = False) -> None:
+        lane = self.lanes[self.lane_of(entry[1])]
+        if front:
+            lane.appendleft(entry)
+        else:
+            lane.append(entry)
+        self._size += 1
+        self._bytes += entry[2]
+        if self.overflow_policy == OVERFLOW_COALESCE:
+            key = self._coalesce_key(entry[1])
+            if key is not None:
+                self._coalesce_index[key] = entry
+
+    def _get(self) -> Tuple[int, Any]:
+        while True:
+            if self._qsize() == 0:
+                # Only unreadable spilled items were left
+                raise queue.Empty
+            lane = self._next_lane()
+            entries = self.lanes[lane]
+            spilled = self._spilled[lane]
+            if spilled and (not entries or spilled[0][0] < entries[0][3]):
+                # The oldest entry of the lane is on disk, it is read back when its turn comes
+                entry = self._unspill(lane)
+                if entry is None:
+                    continue
+            else:
+                entry = entries.popleft()
+                self._forget(entry[1], entry[2])
+            break
+        QUEUE_GETS.inc()
+        self._in_flight[entry[3]] = entry
+        return entry[3], entry[1]
+
+    def _forget(self, item: Any, size: int) -> None:
+        self._size -= 1
+        self._bytes -= size
+        if self._coalesce_index:
+            key = self._coalesce_key(item)
+            entry = self._coalesce_index.get(key) if key is not None else None
+            if entry is not None and entry[1] is item:
+                del self._coalesce_index[key]
+
+    def _next_lane(self) -> int:
+        if self.lanes[PRIORITY_LANE]:
+            return PRIORITY_LANE
+        for _ in range(2):
+            for lane, credits in self._credits.items():
+                if credits > 0 and (self.lanes[lane] or self._spilled[lane]):
+                    self._credits[lane] -= 1
+                    return lane
+            self._credits = dict(LANE_WEIGHTS)
+        return next(lane for lane, entries in self.lanes.items() if entries or self._spilled[lane])
+
+    def _coalesce_key(self, item: Any) -> Hashable | None:
+        try:
+            message_type, message = item
+            if message_type == PublishType.REPORT:
+                # Every report chunk carries different rows
+                return None
+            if "event" in message:
+                return (message_type, message.get(DEVICE_KEY), message.get("event"), message.get("description"))
+            return (message_type, frozenset(message))
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+    def _coalesce(self, item: Any) -> bool:
+        if self.overflow_policy != OVERFLOW_COALESCE or self.lane_of(item) == PRIORITY_LANE:
+            return False
+        key = self._coalesce_key(item)
+        entry = self._coalesce_index.get(key) if key is not None else None
+        if entry is None:
+            return False
+        # Keep the newest values on the queued entry and count the repeats
+        queued = entry[1]
+        repeat_count = queued[1].get("repeat_count", 1) + item[1].get("repeat_count", 1)
+        queued[1].update(item[1])
+        queued[1]["repeat_count"] = repeat_count
+        payload = encode_item(queued)
+        if self.journal is not None and entry[0] is not None:
+            # The merged values replace the journaled ones, otherwise a replay would restore the old entry
+            try:
+                offset = self.journal.append(queued, payload)
+                self.journal.ack(entry[0])
+                entry[0] = offset
+            except Exception as e:
+                logger.error(f"Error journaling a coalesced item, a replay restores its previous values: {e}")
+        self._bytes += len(payload) - entry[2]
+        entry[2] = len(payload)
+        self.overflow_stats["coalesced"] += 1
+        return True
+
+    def _enforce_budget(self) -> None:
+        while self._bytes > self.max_bytes:
+            lane = next((lane for lane in EVICTABLE_LANES if self.lanes[lane]), None)
+            if lane is None:
+                # Only severe alarms are left, those are never dropped
+                return
+            offset, item, size, ticket = self.lanes[lane].popleft()
+            self._forget(item, size)
+            if self.spill is not None:
+                position = self.spill.push(offset, ticket, encode_item(item))
+                heapq.heappush(self._spilled[lane], (ticket, position, offset))
+                self.overflow_stats["spilled"] += 1
+                continue
+            self.unfinished_tasks -= 1
+            self.overflow_stats["dropped"] += 1
+            if offset is not None and self.journal is not None:
+                self.journal.ack(offset)
+            if self.overflow_stats["dropped"] % 1000 == 1:
+                logger.warning(f"Queue memory budget exceeded, {self.overflow_stats['dropped']} low severity items dropped so far")
+
+    def _unspill(self, lane: int) -> List[Any] | None:
+        # Reads back the oldest spilled entry of the lane. An unreadable one is dropped and acked, so it
+        # is not replayed from the journal on every restart
+        ticket, position, offset = heapq.heappop(self._spilled[lane])
+        record = self.spill.pop(position)
+        item = None
+        if record is not None:
             try:
-                items: List[Any] = load_from_file(file_path)
-                for item in items:
-                    self.put(item)
-            except FileNotFoundError:
-                logger.warning(f"File {file_path} not found. Creating a new queue.")
-            except EOFError:
-                logger.debug("No pending events or reports")
+                item = decode_item(record[2])
             except Exception as e:
-                logger.error(f"Unknown error loading queue: {e}")
\ No newline at end of file
+                logger.error(f"Discarding unreadable spilled item: {e}")
+        if item is None:
+            self.unfinished_tasks -= 1
+            self.overflow_stats["dropped"] += 1
+            if offset is not None and self.journal is not None:
+                self.journal.ack(offset)
+            return None
+        self.overflow_stats["unspilled"] += 1
+        return [offset, item, len(record[2]), ticket]
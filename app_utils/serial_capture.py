@@ -0,0 +1,112 @@
+import os
+import struct
+import time
+import logging
+from typing import BinaryIO, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_MAGIC = b'FACPCAP'
+CAPTURE_VERSION = 1
+# magic, format version, wall clock time the file was started (ns since the epoch)
+_FILE_HEADER = struct.Struct('<7sBq')
+# ns since the file was started (monotonic clock), length of the bytes read
+_RECORD_HEADER = struct.Struct('<QI')
+# Records are written through a buffer and reach the disk at most this late (or on flush/close)
+FLUSH_INTERVAL = 1.0
+_BUFFER_SIZE = 64 * 1024
+
+class CaptureWriter:
+    # Records every serial read with its time, rotating like RotatingFileHandler: path, path.1 ... path.<backup_count>
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._file: BinaryIO | None = None
+        self._started_ns = 0
+        self._size = 0
+        self._dirty = False
+        self._flushed_at = 0.0
+
+    def write(self, data: bytes) -> None:
+        if not data:
+            return
+        record_size = _RECORD_HEADER.size + len(data)
+        if self._file is not None and self.max_bytes and self._size + record_size > self.max_bytes:
+            self._rotate()
+        if self._file is None:
+            self._open()
+        self._file.write(_RECORD_HEADER.pack(time.perf_counter_ns() - self._started_ns, len(data)))
+        self._file.write(data)
+        self._size += record_size
+        self._dirty = True
+        if time.monotonic() - self._flushed_at >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        # Also called by the reader while the port is idle, so a quiet panel's last reads reach the disk
+        if self._file is not None and self._dirty:
+            self._file.flush()
+            self._dirty = False
+        self._flushed_at = time.monotonic()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._dirty = False
+
+    def _open(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            # A restart must not overwrite the capture of whatever caused it
+            self._rotate()
+        self._file = open(self.path, 'wb', buffering=_BUFFER_SIZE)
+        self._started_ns = time.perf_counter_ns()
+        self._file.write(_FILE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, time.time_ns()))
+        self._size = _FILE_HEADER.size
+        self._flushed_at = time.monotonic()
+
+    def _rotate(self) -> None:
+        self.close()
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+def read_capture(paths: List[str]) -> Iterator[Tuple[float, bytes]]:
+    # Yields (seconds since the start of the first file, bytes read) across rotated files given oldest first.
+    # A file without the capture header is raw panel output and is yielded as a single read at its start.
+    first_start_ns: int | None = None
+    offset = 0.0
+    for path in paths:
+        with open(path, 'rb') as file:
+            header = file.read(_FILE_HEADER.size)
+            if len(header) < _FILE_HEADER.size or header[:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+                data = header + file.read()
+                yield offset, data
+                continue
+            _, version, started_ns = _FILE_HEADER.unpack(header)
+            if version != CAPTURE_VERSION:
+                raise ValueError(f"Unsupported capture version {version} in {path}")
+            if first_start_ns is None:
+                first_start_ns = started_ns
+            base = (started_ns - first_start_ns) / 1e9
+            while True:
+                record_header = file.read(_RECORD_HEADER.size)
+                if len(record_header) < _RECORD_HEADER.size:
+                    if record_header:
+                        logger.warning(f"Truncated record at the end of {path}, ignoring the tail")
+                    break
+                elapsed_ns, length = _RECORD_HEADER.unpack(record_header)
+                data = file.read(length)
+                if len(data) < length:
+                    logger.warning(f"Truncated record at the end of {path}, ignoring the tail")
+                    break
+                offset = base + elapsed_ns / 1e9
+                yield offset, data
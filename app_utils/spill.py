@@ -0,0 +1,62 @@
+import os
+import struct
+import zlib
+import logging
+from typing import BinaryIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+# journal offset (-1 when not journaled), queue ticket, payload length, crc32 of the payload
+_HEADER = struct.Struct('<qQII')
+
+class SpillFile:
+    # Append-only file of spilled queue items. Records are read back by position in any order, the file is
+    # truncated once none is left
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._file: BinaryIO | None = None
+
+    def push(self, offset: int | None, ticket: int, payload: bytes) -> int:
+        # Returns the position of the record
+        if self._file is None:
+            self._file = open(self.path, 'w+b')
+        position = self._file.seek(0, os.SEEK_END)
+        self._file.write(_HEADER.pack(-1 if offset is None else offset, ticket, len(payload), zlib.crc32(payload)))
+        self._file.write(payload)
+        self.count += 1
+        return position
+
+    def pop(self, position: int) -> Tuple[int | None, int, bytes] | None:
+        # None when the record cannot be read back, it is gone either way
+        try:
+            return self.peek(position)
+        finally:
+            self.count -= 1
+            if self.count == 0:
+                self._reset()
+
+    def peek(self, position: int) -> Tuple[int | None, int, bytes] | None:
+        self._file.seek(position)
+        header = self._file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            logger.error(f"Spill file {self.path} is shorter than expected")
+            return None
+        offset, ticket, length, crc = _HEADER.unpack(header)
+        payload = self._file.read(length)
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            logger.error(f"Corrupted record in spill file {self.path}")
+            return None
+        return (None if offset < 0 else offset), ticket, payload
+
+    def _reset(self) -> None:
+        self.count = 0
+        if self._file is not None:
+            self._file.seek(0)
+            self._file.truncate()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self.path)
@@ -0,0 +1,66 @@
+import os
+import fcntl
+import termios
+import threading
+from array import array
+
+# Stand-in for serial.Serial backed by an os.pipe, so the selector reader works on it.
+# Used by capture replay and the benchmarks in place of a panel connection.
+class VirtualSerial:
+    def __init__(self, port: str = "virtual"):
+        self.port = port
+        self._r, self._w = os.pipe()
+        self._write_lock = threading.Lock()
+        self.is_open = True
+
+    def fileno(self) -> int:
+        return self._r
+
+    @property
+    def in_waiting(self) -> int:
+        if not self.is_open:
+            raise OSError("Pipe serial is closed")
+        buf = array('i', [0])
+        fcntl.ioctl(self._r, termios.FIONREAD, buf)
+        return buf[0]
+
+    def read(self, size: int = 1) -> bytes:
+        return os.read(self._r, size)
+
+    def readinto(self, buffer) -> int:
+        return os.readv(self._r, [buffer])
+
+    def readline(self) -> bytes:
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            chunk = os.read(self._r, 1)
+            if not chunk:
+                break
+            line += chunk
+        return bytes(line)
+
+    def feed(self, data: bytes) -> None:
+        with self._write_lock:
+            view = memoryview(data)
+            while view:
+                written = os.write(self._w, view)
+                view = view[written:]
+
+    def reset_input_buffer(self) -> None:
+        os.set_blocking(self._r, False)
+        try:
+            while os.read(self._r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        finally:
+            os.set_blocking(self._r, True)
+
+    def open(self) -> None:
+        self.is_open = True
+
+    def close(self) -> None:
+        if self.is_open:
+            self.is_open = False
+            os.close(self._w)
+            os.close(self._r)
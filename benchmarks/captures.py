@@ -0,0 +1,51 @@
+from typing import Callable, Dict, List, Tuple
+
+DELIMITER = b"-----------------\r\n"
+NFS_DELIMITER = b"************\r\n"
+
+def _iO1000_event(i: int) -> bytes:
+    event = b"HUMO ACT" if i % 10 == 0 else b"FALL ACT"
+    return event + b" | 12:%02d:%02d 01/01/25 Zona %d | Modulo %d\r\nDetector piso %d\r\n\r\n" % (i // 60 % 60, i % 60, i, i, i % 20)
+
+def _est3x_event(i: int) -> bytes:
+    event = b"ALRM ACT" if i % 10 == 0 else b"TRBL ACT"
+    return event + b":: 12:%02d:%02d 01/01/25 Zona %d\r\nDetector piso %d\r\n\r\n" % (i // 60 % 60, i % 60, i, i % 20)
+
+def _nfs_event(i: int) -> bytes:
+    event = b"FIRE ALARM:" if i % 10 == 0 else b"TROUBL IN SYSTEM"
+    return event + b"   ZONE L1M%d   DETECTOR %d\r\n" % (i, i % 20)
+
+def _simplex_event(i: int) -> bytes:
+    status = b"ALARM" if i % 10 == 0 else b"TROUBLE"
+    return b"%d:%02d:%02d am WED 12-FEB-25\rZONE %d    SMOKE DETECTOR    %s\r\r\n" % (i // 3600 % 12 + 1, i // 60 % 60, i % 60, i, status)
+
+def _iO1000_report(lines: int) -> bytes:
+    rows = b"".join(b"FALL ACT | 11:%02d:%02d 01/01/25 Zona %d\r\n" % (i // 60 % 60, i % 60, i) for i in range(lines))
+    return DELIMITER + b"REPORTE DE HISTORIA\r\n" + DELIMITER + rows + DELIMITER + DELIMITER + b"\r\n"
+
+def _est3x_report(lines: int) -> bytes:
+    rows = b"".join(b"TRBL ACT:: 11:%02d:%02d 01/01/25 Zona %d\r\n" % (i // 60 % 60, i % 60, i) for i in range(lines))
+    return DELIMITER + b"HISTORY REPORT\r\n" + DELIMITER + rows + b"** END OF REPORT **\r\n\r\n"
+
+def _nfs_report(lines: int) -> bytes:
+    rows = b"".join(b"TROUBL IN SYSTEM   ZONE L1M%d   DETECTOR %d\r\n" % (i, i % 20) for i in range(lines))
+    return NFS_DELIMITER + b"HISTORY REPORT\r\n" + rows + NFS_DELIMITER
+
+def _simplex_report(lines: int) -> bytes:
+    # Simplex history dumps are timestamped lines, each one framed as an event
+    return b"".join(_simplex_event(i) for i in range(lines))
+
+PANELS: Dict[str, Tuple[Callable[[int], bytes], Callable[[int], bytes]]] = {
+    "Edwards_iO1000": (_iO1000_event, _iO1000_report),
+    "Edwards_EST3x": (_est3x_event, _est3x_report),
+    "Notifier_NFS": (_nfs_event, _nfs_report),
+    "Simplex": (_simplex_event, _simplex_report),
+}
+
+def synthetic_events(panel: str, count: int) -> List[bytes]:
+    event, _ = PANELS[panel]
+    return [event(i) for i in range(count)]
+
+def synthetic_report(panel: str, lines: int) -> bytes:
+    _, report = PANELS[panel]
+    return report(lines)
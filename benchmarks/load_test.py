@@ -0,0 +1,245 @@
+import argparse
+import logging
+import os
+import resource
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+from app.core import Application
+from app.replay import panel_model
+from app_utils.virtual_serial import VirtualSerial
+from benchmarks.captures import PANELS
+from benchmarks.parser_benchmark import BENCH_CONFIG, _percentile
+from benchmarks.tb_emulator import ThingsBoardEmulator
+from config.loader import load_event_severity_levels
+from config.schema import ConfigSchema
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEVICE_TOKEN = "load-test"
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Peak instead of current on systems without procfs (kB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def load_test_config(args: argparse.Namespace, port: int) -> ConfigSchema:
+    config = {key: value for key, value in BENCH_CONFIG.items() if key not in ("serial", "id_modelo_panel")}
+    config["thingsboard"] = {"device_token": DEVICE_TOKEN, "host": "127.0.0.1", "port": port}
+    config["mqtt"] = {"inflight_window": args.inflight_window, "batch_size": args.batch_size, "rate_limits": args.rate_limits,
+                      "reconnect_max_delay": args.reconnect_max_delay}
+    config["queue"] = {"max_bytes": args.queue_max_bytes, "overflow_policy": args.overflow_policy}
+    config["runtime"] = {"mode": args.runtime}
+    panels = [{"device_name": f"Load {index} {panel}", "id_modelo_panel": panel_model(panel), "serial": {"puerto": f"load{index}"}}
+              for index, panel in enumerate(args.panels)]
+    if len(panels) == 1:
+        config["id_modelo_panel"] = panels[0]["id_modelo_panel"]
+        config["serial"] = panels[0]["serial"]
+    else:
+        config["panels"] = panels
+    return ConfigSchema(**config)
+
+def load_test_application(config: ConfigSchema, event_severity_levels: dict, serial_ports: Dict[str, VirtualSerial]) -> Application:
+    app_class = Application
+    if config.runtime.mode == "asyncio":
+        from app.async_runtime import AsyncApplication
+        app_class = AsyncApplication
+
+    class LoadTestApplication(app_class):
+        # Panels are pipes fed by the load test instead of serial devices
+        def _create_serial_handler(self, panel):
+            handler = super()._create_serial_handler(panel)
+            handler.ser = serial_ports.setdefault(panel.serial.puerto, VirtualSerial(panel.serial.puerto))
+            return handler
+
+    return LoadTestApplication(config, event_severity_levels)
+
+class LoadTest:
+    # Runs the whole gateway (serial handlers, queue, journal, MQTT sender) against the emulator. The
+    # application owns the main thread like in production, the scenarios run in a driver thread and end
+    # it with SIGINT, which both runtimes treat as a shutdown request.
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.emulator = ThingsBoardEmulator(tokens=[DEVICE_TOKEN], messages_limit=args.server_messages_limit,
+                                            telemetry_limit=args.server_telemetry_limit, ack_delay=args.ack_delay)
+        self.serial_ports: Dict[str, VirtualSerial] = {}
+        self.app: Application | None = None
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.fed = 0
+        self.next_index = 0
+        self.samples: List[Dict[str, int]] = []
+
+    def run(self) -> Dict[str, Dict[str, Any]]:
+        port = self.emulator.start()
+        config = load_test_config(self.args, port)
+        levels = load_event_severity_levels(os.path.join(REPO_DIR, "config", "eventSeverityLevels.yml"))
+        # The journal, backup and spill files are created in the working directory
+        work_dir = tempfile.mkdtemp(prefix="facp-load-")
+        previous_dir = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            self.app = load_test_application(config, levels, self.serial_ports)
+            threading.Thread(target=self._drive, name="load_test", daemon=True).start()
+            self.app.start()
+        finally:
+            os.chdir(previous_dir)
+            shutil.rmtree(work_dir, ignore_errors=True)
+            self.emulator.stop()
+        return self.results
+
+    def _drive(self) -> None:
+        try:
+            if not self._wait(lambda: self.app.mqtt_handler.is_connected() and len(self.serial_ports) == len(self.args.panels), 15):
+                logging.getLogger(__name__).error("The gateway did not connect to the emulator")
+                return
+            self.results["sustained"] = self.sustained()
+            if self.args.outage > 0:
+                self.results["outage"] = self.outage()
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Load test failed: {e}")
+        finally:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    def sustained(self) -> Dict[str, Any]:
+        args = self.args
+        self.emulator.reset()
+        self.fed = 0
+        start = time.monotonic()
+        self._feed(args.duration)
+        fed_done = time.monotonic()
+        self.emulator.wait_for_events(self.fed, args.drain_timeout)
+        done = time.monotonic()
+        # Publishes still waiting for their PUBACK would be resent into the next scenario
+        self._wait(self._settled, args.drain_timeout)
+        received = self.emulator.events_received()
+        latencies = [latency * 1000 for latency in self.emulator.latencies]
+        return {
+            "fed": self.fed,
+            "received": received,
+            "events_per_s": received / (done - start),
+            "drain_s": done - fed_done,
+            "latency_p50_ms": _percentile(latencies, 50),
+            "latency_p99_ms": _percentile(latencies, 99),
+            "peak_queue": max((sample["queue"] for sample in self.samples), default=0),
+            "rate_limited": self.emulator.stats["rate_limited"],
+        }
+
+    def outage(self) -> Dict[str, Any]:
+        args = self.args
+        emulator = self.emulator
+        emulator.reset()
+        self.fed = 0
+        before = self._sample()
+        emulator.outage(args.outage)
+        # Panel traffic keeps coming while ThingsBoard is unreachable
+        self._feed(args.outage)
+        outage_end = time.monotonic()
+        peak = {key: max(sample[key] for sample in self.samples) for key in before}
+        recovered = self._wait(lambda: emulator.unique_events() >= self.fed and self._settled(), args.drain_timeout)
+        recovery_s = time.monotonic() - outage_end
+        after = self._sample()
+        return {
+            "fed": self.fed,
+            "received": emulator.events_received(),
+            "recovered": recovered,
+            "recovery_s": recovery_s,
+            "lost": self.fed - emulator.unique_events(),
+            "duplicates": emulator.stats["duplicates"],
+            "reconnects": emulator.stats["connects"],
+            "peak_queue": peak["queue"],
+            "peak_queue_kib": peak["queue_bytes"] / 1024,
+            "peak_journal_kib": peak["journal_bytes"] / 1024,
+            "rss_growth_kib": (peak["rss"] - before["rss"]) / 1024,
+            "rss_retained_kib": (after["rss"] - before["rss"]) / 1024,
+            "queue_kib_after": after["queue_bytes"] / 1024,
+        }
+
+    def _feed(self, duration: float) -> None:
+        # Synthetic events at args.rate per second spread over the panels, sampling the queue as it goes
+        args = self.args
+        self.samples = []
+        ports = [self.serial_ports[f"load{index}"] for index in range(len(args.panels))]
+        events = [PANELS[panel][0] for panel in args.panels]
+        start = time.monotonic()
+        last_sample = 0.0
+        while True:
+            elapsed = time.monotonic() - start
+            if elapsed >= duration:
+                break
+            due = int(elapsed * args.rate) - self.fed
+            for _ in range(due):
+                # Indexes keep growing across scenarios so every event is unique to the emulator
+                panel = self.next_index % len(ports)
+                ports[panel].feed(events[panel](self.next_index // len(ports)))
+                self.next_index += 1
+                self.fed += 1
+            if elapsed - last_sample >= args.sample_interval:
+                self.samples.append(self._sample())
+                last_sample = elapsed
+            time.sleep(0.01)
+        self.samples.append(self._sample())
+
+    def _settled(self) -> bool:
+        window = self.app.mqtt_handler.window
+        return self.app.queue.qsize() == 0 and (window is None or len(window) == 0)
+
+    def _sample(self) -> Dict[str, int]:
+        queue = self.app.queue
+        return {"queue": queue.qsize(), "queue_bytes": queue.memory_usage(),
+                "journal_bytes": directory_size("queue_journal"), "rss": rss_bytes()}
+
+    def _wait(self, condition, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+def _print_result(scenario: str, result: Dict[str, Any]) -> None:
+    values = "  ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}" for key, value in result.items())
+    print(f"{scenario:<10} {values}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End to end load test of the gateway against a local ThingsBoard emulator")
+    parser.add_argument("--panels", nargs="+", choices=sorted(PANELS), default=["Edwards_iO1000"],
+                        help="One simulated panel per entry, more than one runs in gateway mode")
+    parser.add_argument("--runtime", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--rate", type=float, default=200, help="Panel events per second, all panels together")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of sustained traffic")
+    parser.add_argument("--outage", type=float, default=10, help="Seconds ThingsBoard is unreachable, 0 skips the outage scenario")
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--sample-interval", type=float, default=0.5)
+    parser.add_argument("--ack-delay", type=float, default=0.0, help="Seconds before the emulator acknowledges a publish")
+    parser.add_argument("--server-messages-limit", default="", help="Emulator rate limit, e.g. 100:1,3000:60")
+    parser.add_argument("--server-telemetry-limit", default="")
+    parser.add_argument("--inflight-window", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--rate-limits", default="100:1,3000:60,7000:3600", help="Client side mqtt.rate_limits")
+    parser.add_argument("--reconnect-max-delay", type=float, default=5)
+    parser.add_argument("--queue-max-bytes", type=int, default=0)
+    parser.add_argument("--overflow-policy", choices=["drop_oldest", "coalesce", "spill"], default="drop_oldest")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = LoadTest(args).run()
+    for scenario, result in results.items():
+        _print_result(scenario, result)
+
+if __name__ == "__main__":
+    main()
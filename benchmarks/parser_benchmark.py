@@ -0,0 +1,221 @@
+import argparse
+import gc
+import logging
+import math
+import statistics
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Any
+from config.schema import ConfigSchema
+from app_utils.queue_operations import SafeQueue
+from classes import specific_serial_handler
+from classes.enums import FrameKind
+from classes.framing import Framer
+from classes.serial_port_handler import SerialPortHandler
+from app_utils.virtual_serial import VirtualSerial
+from app_utils.serial_capture import read_capture
+from benchmarks.captures import PANELS, synthetic_events, synthetic_report
+
+BENCH_CONFIG = {
+    "thingsboard": {"device_token": "benchmark", "host": "localhost", "port": 1883},
+    "serial": {"puerto": "pipe"},
+    "relay": {"pin": 8, "high_time": 1, "low_time": 60},
+    "relay_monitor": {"alarm_pin": 13, "trouble_pin": 27, "publish_interval": 15,
+                      "alarm_active_high": True, "trouble_active_high": False},
+    "gpio": {"backend": "simulated"},
+    "id_modelo_panel": 10001,
+}
+
+class TimedQueue(SafeQueue):
+    def __init__(self):
+        super().__init__()
+        self.put_times: List[float] = []
+
+    def _put(self, item: Any) -> None:
+        self.put_times.append(time.perf_counter())
+        super()._put(item)
+
+    def wait_for_count(self, count: int, timeout: float) -> bool:
+        with self.not_empty:
+            return self.not_empty.wait_for(lambda: len(self.put_times) >= count, timeout)
+
+    def wait_until_idle(self, idle: float, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        seen = -1
+        while time.monotonic() < deadline and seen != len(self.put_times):
+            seen = len(self.put_times)
+            time.sleep(idle)
+
+class HandlerRunner:
+    def __init__(self, panel: str, severity_levels: Dict[str, int] | None = None):
+        self.queue = TimedQueue()
+        handler_class = getattr(specific_serial_handler, panel)
+        self.handler: SerialPortHandler = handler_class(ConfigSchema(**BENCH_CONFIG), severity_levels or {}, self.queue)
+        self.serial = VirtualSerial("pipe")
+        self.shutdown_flag = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"bench-{panel}", daemon=True)
+
+    def _run(self) -> None:
+        try:
+            self.handler.process_incoming_data(self.shutdown_flag)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Reader stopped: {e}")
+
+    def __enter__(self) -> "HandlerRunner":
+        self.handler.ser = self.serial
+        self.handler._register_selector()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown_flag.set()
+        self.handler.wakeup()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
+        self.close()
+
+    def close(self) -> None:
+        self.handler.close_wakeup_pipe()
+        self.serial.close()
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def bench_latency(panel: str, events: int, interval: float) -> Dict[str, float]:
+    chunks = synthetic_events(panel, events)
+    send_times: List[float] = []
+    with HandlerRunner(panel) as runner:
+        for chunk in chunks:
+            send_times.append(time.perf_counter())
+            runner.serial.feed(chunk)
+            if interval:
+                time.sleep(interval)
+        runner.queue.wait_for_count(len(chunks), timeout=30)
+        put_times = runner.queue.put_times
+    latencies = [(put - sent) * 1000 for sent, put in zip(send_times, put_times)]
+    return {
+        "events": len(put_times),
+        "p50_ms": statistics.median(latencies) if latencies else float("nan"),
+        "p99_ms": _percentile(latencies, 99),
+    }
+
+def bench_throughput(panel: str, events: int) -> Dict[str, float]:
+    data = b"".join(synthetic_events(panel, events))
+    with HandlerRunner(panel) as runner:
+        start = time.perf_counter()
+        runner.serial.feed(data)
+        runner.queue.wait_for_count(events, timeout=60)
+        put_times = runner.queue.put_times
+    elapsed = (put_times[-1] - start) if put_times else float("nan")
+    return {"events": len(put_times), "events_per_s": len(put_times) / elapsed, "mb_per_s": len(data) / elapsed / 1e6}
+
+def _queue_entries(handler: SerialPortHandler, data: bytes) -> int:
+    framer = Framer(handler.framing_rules)
+    frames = framer.feed(data) + framer.flush()
+    rows = sum(1 for kind, _ in frames if kind == FrameKind.REPORT_ROW)
+    events = sum(1 for kind, _ in frames if kind == FrameKind.EVENT)
+    return events + math.ceil(rows / handler.report_chunker.chunk_rows)
+
+def bench_burst(panel: str, report_lines: int) -> Dict[str, float]:
+    report = synthetic_report(panel, report_lines)
+    alarm = synthetic_events(panel, 1)[0]
+    with HandlerRunner(panel) as runner:
+        expected = _queue_entries(runner.handler, report + alarm)
+        start = time.perf_counter()
+        runner.serial.feed(report)
+        alarm_sent = time.perf_counter()
+        runner.serial.feed(alarm)
+        runner.queue.wait_for_count(expected, timeout=60)
+        put_times = runner.queue.put_times
+    done = put_times[-1] if put_times else float("nan")
+    return {
+        "report_kib": len(report) / 1024,
+        "drain_ms": (done - start) * 1000,
+        "alarm_after_burst_ms": (done - alarm_sent) * 1000,
+    }
+
+def bench_allocations(panel: str, events: int) -> Dict[str, float]:
+    data = b"".join(synthetic_events(panel, events))
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with HandlerRunner(panel) as runner:
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            base_current, _ = tracemalloc.get_traced_memory()
+            runner.serial.feed(data)
+            runner.queue.wait_for_count(events, timeout=120)
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    retained = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    return {
+        "retained_blocks_per_event": blocks / events,
+        "retained_bytes_per_event": retained / events,
+        "peak_bytes_per_event": (peak - base_current) / events,
+    }
+
+def bench_parse_only(panel: str, events: int) -> Dict[str, float]:
+    runner = HandlerRunner(panel)
+    try:
+        framer = Framer(runner.handler.framing_rules)
+        frames = framer.feed(b"".join(synthetic_events(panel, events)))
+        start = time.perf_counter()
+        for _, text in frames:
+            runner.handler.parse_string_event(text)
+        elapsed = time.perf_counter() - start
+    finally:
+        runner.close()
+    return {"events": len(frames), "events_per_s": len(frames) / elapsed}
+
+def bench_capture(panel: str, capture_path: str) -> Dict[str, float]:
+    # Timing in a recorded capture is ignored here, everything is fed at once (see main.py --replay)
+    data = b"".join(chunk for _, chunk in read_capture([capture_path]))
+    with HandlerRunner(panel) as runner:
+        start = time.perf_counter()
+        runner.serial.feed(data)
+        runner.queue.wait_until_idle(idle=runner.handler.framing_rules.partial_line_timeout + 0.5, timeout=300)
+        put_times = runner.queue.put_times
+    elapsed = (put_times[-1] - start) if put_times else float("nan")
+    return {"bytes": len(data), "frames_queued": len(put_times), "events_per_s": len(put_times) / elapsed}
+
+def _print_result(panel: str, scenario: str, result: Dict[str, float]) -> None:
+    values = "  ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}" for key, value in result.items())
+    print(f"{panel:<16} {scenario:<12} {values}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline throughput and latency benchmark for the FACP panel parsers")
+    parser.add_argument("--panel", choices=list(PANELS) + ["all"], default="all")
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--latency-events", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=0.002, help="Seconds between events in the latency scenario")
+    parser.add_argument("--report-lines", type=int, default=5000)
+    parser.add_argument("--capture", help="Raw or recorded serial capture to replay through the selected panel instead of synthetic data")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    panels = list(PANELS) if args.panel == "all" else [args.panel]
+
+    if args.capture:
+        if len(panels) != 1:
+            parser.error("--capture needs a single --panel")
+        _print_result(panels[0], "capture", bench_capture(panels[0], args.capture))
+        return
+
+    for panel in panels:
+        _print_result(panel, "parse_only", bench_parse_only(panel, args.events))
+        _print_result(panel, "throughput", bench_throughput(panel, args.events))
+        _print_result(panel, "latency", bench_latency(panel, args.latency_events, args.interval))
+        _print_result(panel, "burst", bench_burst(panel, args.report_lines))
+        _print_result(panel, "allocations", bench_allocations(panel, min(args.events, 2000)))
+
+if __name__ == "__main__":
+    main()
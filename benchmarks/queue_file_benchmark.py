@@ -0,0 +1,61 @@
+import argparse
+import os
+import pickle
+import tempfile
+import time
+from typing import Any, Dict, List
+from app_utils.file_operations import save_to_file, iter_file
+from classes.enums import PublishType
+from classes.event_record import EventRecord
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+def queued_items(count: int) -> List[Any]:
+    items: List[Any] = []
+    for i in range(count):
+        if i % 100 == 99:
+            items.append((PublishType.TELEMETRY, {"alarm_relay": False, "trouble_relay": i % 2 == 0}))
+        else:
+            items.append((PublishType.TELEMETRY, EventRecord("TRBL ACT", f"Zona | {i % 500}", i % 4, "11:00:00 01/01/25")))
+    return items
+
+def bench_pickle(items: List[Any], path: str) -> Dict[str, float]:
+    start = time.perf_counter()
+    with open(path, 'wb') as file:
+        pickle.dump(items, file)
+    saved = time.perf_counter()
+    with open(path, 'rb') as file:
+        loaded = pickle.load(file)
+    first = time.perf_counter()
+    return {"save_s": saved - start, "load_s": first - saved, "first_item_s": first - saved,
+            "bytes": os.path.getsize(path), "items": len(loaded)}
+
+def bench_records(items: List[Any], path: str) -> Dict[str, float]:
+    start = time.perf_counter()
+    save_to_file(items, path)
+    saved = time.perf_counter()
+    records = iter_file(path)
+    next(records)
+    first = time.perf_counter()
+    count = 1 + sum(1 for _ in records)
+    loaded = time.perf_counter()
+    return {"save_s": saved - start, "load_s": loaded - saved, "first_item_s": first - saved,
+            "bytes": os.path.getsize(path), "items": count}
+
+def _print_result(size: int, fmt: str, result: Dict[str, float]) -> None:
+    values = "  ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}" for key, value in result.items())
+    print(f"{size:<10} {fmt:<8} {values}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Save and load time of the queue backup file, pickle vs the record format")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            items = queued_items(size)
+            _print_result(size, "pickle", bench_pickle(items, os.path.join(directory, "queue.pkl")))
+            _print_result(size, "records", bench_records(items, os.path.join(directory, "queue.bin")))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+import argparse
+import asyncio
+import json
+import logging
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Set, Tuple
+from classes.event_record import SBC_DATE_FORMAT
+from classes.mqtt_sender import TokenBucket
+from classes.telemetry_encoding import decode_batch
+
+logger = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK, SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 1, 2, 3, 4, 8, 9, 10, 11, 12, 13, 14
+
+# MQTT 5 reason codes the ThingsBoard transport answers with
+SUCCESS = 0x00
+NOT_AUTHORIZED = 0x87
+SERVER_UNAVAILABLE = 0x88
+QUOTA_EXCEEDED = 0x97
+
+RPC_REQUEST_TOPIC = "v1/devices/me/rpc/request/"
+RPC_RESPONSE_TOPIC = "v1/devices/me/rpc/response/"
+ATTRIBUTES_REQUEST_TOPIC = "v1/devices/me/attributes/request/"
+ATTRIBUTES_RESPONSE_TOPIC = "v1/devices/me/attributes/response/"
+TELEMETRY_TOPICS = ("v1/devices/me/telemetry", "v1/gateway/telemetry")
+ATTRIBUTE_TOPICS = ("v1/devices/me/attributes", "v1/gateway/attributes")
+
+class RateLimit:
+    # ThingsBoard rate limit syntax, <amount>:<seconds> windows, "" = unlimited
+    def __init__(self, limits: str = ""):
+        self.limits = limits
+        self.buckets: List[TokenBucket] = []
+        for window in filter(None, limits.split(',')):
+            capacity, period = window.split(':')
+            if int(capacity) > 0:
+                self.buckets.append(TokenBucket(int(capacity), float(period)))
+
+    def try_consume(self, amount: int = 1) -> bool:
+        now = time.monotonic()
+        for bucket in self.buckets:
+            bucket.refill(now)
+        if any(bucket.tokens < amount for bucket in self.buckets):
+            return False
+        for bucket in self.buckets:
+            bucket.tokens -= amount
+        return True
+
+class ThingsBoardEmulator:
+    # Minimal MQTT broker speaking the ThingsBoard device and gateway API, for load tests without a server.
+    # Telemetry and attributes are counted, not stored; requests for attributes and session limits are
+    # answered. Rate limits, PUBACK latency and outages can be set while clients are connected.
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, tokens: List[str] | None = None,
+                 messages_limit: str = "", telemetry_limit: str = "", datapoints_limit: str = "",
+                 rate_limit_action: str = "reject", ack_delay: float = 0.0):
+        self.host = host
+        self.port = port
+        self.tokens = set(tokens) if tokens else None
+        self.messages_limit = messages_limit
+        self.telemetry_limit = telemetry_limit
+        self.datapoints_limit = datapoints_limit
+        # "reject" answers over-limit publishes with PUBACK 0x97, "disconnect" closes the session like older versions
+        self.rate_limit_action = rate_limit_action
+        self.ack_delay = ack_delay
+        self.outage_until = 0.0
+        self.stats: Dict[str, int] = {"connects": 0, "refused": 0, "disconnects": 0, "publishes": 0, "telemetry_messages": 0,
+                                      "events": 0, "datapoints": 0, "attributes": 0, "rate_limited": 0, "duplicates": 0,
+                                      "payload_bytes": 0}
+        self.latencies: List[float] = []
+        self.first_event_at: float | None = None
+        self.last_event_at: float | None = None
+        self.seen: Set[Tuple[Any, ...]] = set()
+        self.changed = threading.Condition()
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.server: asyncio.AbstractServer | None = None
+        self.sessions: Set["_Session"] = set()
+        self.thread: threading.Thread | None = None
+
+    def start(self) -> int:
+        started = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(started,), name="tb_emulator", daemon=True)
+        self.thread.start()
+        started.wait(5)
+        return self.port
+
+    def stop(self) -> None:
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self._close(), self.loop).result(5)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(5)
+            self.loop = None
+
+    def outage(self, duration: float) -> None:
+        # Drops every connection and refuses new ones for duration seconds
+        self.outage_until = time.monotonic() + duration
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._drop_sessions)
+
+    def events_received(self) -> int:
+        with self.changed:
+            return self.stats["events"]
+
+    def unique_events(self) -> int:
+        with self.changed:
+            return len(self.seen)
+
+    def wait_for_events(self, count: int, timeout: float) -> bool:
+        with self.changed:
+            return self.changed.wait_for(lambda: self.stats["events"] >= count, timeout)
+
+    def reset(self) -> None:
+        with self.changed:
+            for key in self.stats:
+                self.stats[key] = 0
+            self.latencies.clear()
+            self.seen.clear()
+            self.first_event_at = self.last_event_at = None
+
+    def _run(self, started: threading.Event) -> None:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._accept, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    async def _close(self) -> None:
+        self.server.close()
+        self._drop_sessions()
+        await self.server.wait_closed()
+
+    def _drop_sessions(self) -> None:
+        for session in list(self.sessions):
+            session.writer.close()
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = _Session(self, reader, writer)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Emulator session failed: {e}")
+        finally:
+            self.sessions.discard(session)
+            with self.changed:
+                self.stats["disconnects"] += 1
+            writer.close()
+
+    def _record_telemetry(self, payload: Any, device_payload: bool, size: int) -> None:
+        now = time.time()
+        if device_payload:
+            entries = [entry for values in payload.values() for entry in _as_list(values)]
+            devices = [device for device, values in payload.items() for _ in _as_list(values)]
+        else:
+            entries = _as_list(payload)
+            devices = [None] * len(entries)
+        events = 0
+        datapoints = 0
+        with self.changed:
+            for device, entry in zip(devices, entries):
+                for values in _expand(entry):
+                    datapoints += len(values)
+                    # Relay states and metrics share the topic, only panel events are counted as events
+                    if "event" in values:
+                        events += 1
+                        self._record_event(device, values, now)
+            self.stats["telemetry_messages"] += 1
+            self.stats["events"] += events
+            self.stats["datapoints"] += datapoints
+            self.stats["payload_bytes"] += size
+            if events:
+                self.first_event_at = self.first_event_at or now
+                self.last_event_at = now
+            self.changed.notify_all()
+
+    def _record_event(self, device: str | None, values: Dict[str, Any], now: float) -> None:
+        key = (device, values.get("event"), values.get("description"), values.get("FACP_date"), values.get("repeat_count"))
+        if key in self.seen:
+            self.stats["duplicates"] += 1
+        self.seen.add(key)
+        sbc_date = values.get("SBC_date")
+        if sbc_date:
+            try:
+                self.latencies.append(now - datetime.strptime(sbc_date, SBC_DATE_FORMAT).timestamp())
+            except (TypeError, ValueError):
+                pass
+
+    def _session_limits(self) -> Dict[str, Any]:
+        return {"maxPayloadSize": 65536, "maxInflightMessages": 100,
+                "rateLimits": {"messages": self.messages_limit, "telemetryMessages": self.telemetry_limit,
+                               "telemetryDataPoints": self.datapoints_limit}}
+
+class _Session:
+    def __init__(self, emulator: ThingsBoardEmulator, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.emulator = emulator
+        self.reader = reader
+        self.writer = writer
+        self.version = 4
+        self.messages = RateLimit(emulator.messages_limit)
+        self.telemetry = RateLimit(emulator.telemetry_limit)
+        self.datapoints = RateLimit(emulator.datapoints_limit)
+
+    async def run(self) -> None:
+        packet_type, _, body = await self._read_packet()
+        if packet_type != CONNECT:
+            return
+        if not self._connect(body):
+            return
+        while True:
+            packet_type, flags, body = await self._read_packet()
+            if packet_type == PUBLISH:
+                self._publish(flags, body)
+            elif packet_type == SUBSCRIBE:
+                self._subscribe(body)
+            elif packet_type == PUBACK:
+                # Acknowledgement of a response sent with QoS1, nothing is resent here
+                pass
+            elif packet_type == UNSUBSCRIBE:
+                packet_id = body[:2]
+                count = _count_strings(body, 2 + (self._properties_length(body, 2) if self.version == 5 else 0))
+                self._send(UNSUBACK, 0, packet_id + (b"\x00" + bytes(count) if self.version == 5 else b""))
+            elif packet_type == PINGREQ:
+                self._send(PINGRESP, 0, b"")
+            elif packet_type == DISCONNECT:
+                return
+            await self.writer.drain()
+
+    def _connect(self, body: bytes) -> bool:
+        name_length = struct.unpack_from(">H", body)[0]
+        position = 2 + name_length
+        self.version = body[position]
+        flags = body[position + 1]
+        position += 4
+        if self.version == 5:
+            position += self._properties_length(body, position)
+        # client id, [will properties, will topic, will payload], [username], [password]
+        _, position = _read_string(body, position)
+        if flags & 0x04:
+            if self.version == 5:
+                position += self._properties_length(body, position)
+            _, position = _read_string(body, position)
+            _, position = _read_string(body, position)
+        username = _read_string(body, position)[0].decode("utf-8") if flags & 0x80 else None
+        emulator = self.emulator
+        if time.monotonic() < emulator.outage_until:
+            reason = SERVER_UNAVAILABLE if self.version == 5 else 3
+        elif emulator.tokens is not None and username not in emulator.tokens:
+            reason = NOT_AUTHORIZED if self.version == 5 else 5
+        else:
+            reason = SUCCESS
+        self._send(CONNACK, 0, b"\x00" + bytes([reason]) + (b"\x00" if self.version == 5 else b""))
+        with emulator.changed:
+            emulator.stats["connects" if reason == SUCCESS else "refused"] += 1
+        return reason == SUCCESS
+
+    def _publish(self, flags: int, body: bytes) -> None:
+        qos = (flags >> 1) & 0x03
+        topic_length = struct.unpack_from(">H", body)[0]
+        topic = body[2:2 + topic_length].decode("utf-8")
+        position = 2 + topic_length
+        packet_id = b""
+        if qos:
+            packet_id = body[position:position + 2]
+            position += 2
+        if self.version == 5:
+            position += self._properties_length(body, position)
+        payload = body[position:]
+
+        emulator = self.emulator
+        with emulator.changed:
+            emulator.stats["publishes"] += 1
+        reason = self._handle(topic, payload)
+        if reason == QUOTA_EXCEEDED and emulator.rate_limit_action == "disconnect":
+            if self.version == 5:
+                self._send(DISCONNECT, 0, bytes([QUOTA_EXCEEDED, 0]))
+            raise ConnectionResetError("rate limit")
+        if not qos:
+            return
+        puback = packet_id + (bytes([reason]) if self.version == 5 and reason else b"")
+        if emulator.ack_delay:
+            # Network and server latency: the message is taken at once, its PUBACK arrives later
+            emulator.loop.call_later(emulator.ack_delay, self._send_if_open, PUBACK, 0, puback)
+        else:
+            self._send(PUBACK, 0, puback)
+
+    def _handle(self, topic: str, payload: bytes) -> int:
+        emulator = self.emulator
+        try:
+            data = json.loads(payload) if payload else None
+        except ValueError:
+            data = None
+        telemetry = topic in TELEMETRY_TOPICS
+        datapoints = _count_datapoints(data, topic.startswith("v1/gateway/")) if telemetry else 0
+        if not self.messages.try_consume() or (telemetry and not (self.telemetry.try_consume() and self.datapoints.try_consume(datapoints))):
+            with emulator.changed:
+                emulator.stats["rate_limited"] += 1
+            return QUOTA_EXCEEDED
+
+        if telemetry:
+            emulator._record_telemetry(data, topic.startswith("v1/gateway/"), len(payload))
+        elif topic in ATTRIBUTE_TOPICS:
+            with emulator.changed:
+                emulator.stats["attributes"] += 1
+        elif topic.startswith(RPC_REQUEST_TOPIC):
+            request_id = topic[len(RPC_REQUEST_TOPIC):]
+            if isinstance(data, dict) and data.get("method") == "getSessionLimits":
+                self._send_publish(RPC_RESPONSE_TOPIC + request_id, emulator._session_limits())
+        elif topic.startswith(ATTRIBUTES_REQUEST_TOPIC):
+            request_id = topic[len(ATTRIBUTES_REQUEST_TOPIC):]
+            self._send_publish(ATTRIBUTES_RESPONSE_TOPIC + request_id, {"client": {}, "shared": {}})
+        return SUCCESS
+
+    def _subscribe(self, body: bytes) -> None:
+        packet_id = body[:2]
+        position = 2
+        if self.version == 5:
+            position += self._properties_length(body, position)
+        granted = []
+        while position < len(body):
+            length = struct.unpack_from(">H", body, position)[0]
+            options = body[position + 2 + length]
+            granted.append(min(options & 0x03, 1))
+            position += 3 + length
+        self._send(SUBACK, 0, packet_id + (b"\x00" if self.version == 5 else b"") + bytes(granted))
+
+    def _send_publish(self, topic: str, data: Any) -> None:
+        encoded = topic.encode("utf-8")
+        body = struct.pack(">H", len(encoded)) + encoded + (b"\x00" if self.version == 5 else b"")
+        self._send(PUBLISH, 0, body + json.dumps(data).encode("utf-8"))
+
+    def _send_if_open(self, packet_type: int, flags: int, body: bytes) -> None:
+        if not self.writer.is_closing():
+            self._send(packet_type, flags, body)
+
+    def _send(self, packet_type: int, flags: int, body: bytes) -> None:
+        self.writer.write(bytes([packet_type << 4 | flags]) + _encode_length(len(body)) + body)
+
+    async def _read_packet(self) -> Tuple[int, int, bytes]:
+        header = (await self.reader.readexactly(1))[0]
+        length = 0
+        multiplier = 1
+        while True:
+            byte = (await self.reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await self.reader.readexactly(length) if length else b""
+        return header >> 4, header & 0x0F, body
+
+    def _properties_length(self, body: bytes, position: int) -> int:
+        # Size of the properties block including its own length prefix, the values are not needed
+        length, size = _decode_length(body, position)
+        return size + length
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+def _decode_length(data: bytes, position: int) -> Tuple[int, int]:
+    length = 0
+    multiplier = 1
+    size = 0
+    while True:
+        byte = data[position + size]
+        size += 1
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            return length, size
+        multiplier *= 128
+
+def _read_string(body: bytes, position: int) -> Tuple[bytes, int]:
+    length = struct.unpack_from(">H", body, position)[0]
+    return body[position + 2:position + 2 + length], position + 2 + length
+
+def _count_strings(body: bytes, position: int) -> int:
+    count = 0
+    while position + 2 <= len(body):
+        position = _read_string(body, position)[1]
+        count += 1
+    return count
+
+def _as_list(payload: Any) -> List[Any]:
+    return payload if isinstance(payload, list) else [payload]
+
+def _expand(entry: Any) -> List[Dict[str, Any]]:
+    # One telemetry entry: {"ts", "values"} or plain values; a compressed batch holds many entries
+    if not isinstance(entry, dict):
+        return []
+    values = entry.get("values", entry) if "ts" in entry else entry
+    if values.get("batch_encoding"):
+        return [item.get("values", item) for item in decode_batch(values)]
+    return [values]
+
+def _count_datapoints(data: Any, gateway: bool) -> int:
+    if data is None:
+        return 0
+    entries = [entry for values in data.values() for entry in _as_list(values)] if gateway and isinstance(data, dict) else _as_list(data)
+    return sum(len(values) for entry in entries for values in _expand(entry))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local ThingsBoard MQTT stand-in, counts what the gateway sends")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--token", action="append", help="Accepted device token (repeatable), any token if omitted")
+    parser.add_argument("--messages-limit", default="", help="e.g. 100:1,3000:60 (empty = unlimited)")
+    parser.add_argument("--telemetry-limit", default="")
+    parser.add_argument("--datapoints-limit", default="")
+    parser.add_argument("--rate-limit-action", choices=["reject", "disconnect"], default="reject")
+    parser.add_argument("--ack-delay", type=float, default=0.0, help="Seconds before each publish is acknowledged")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    emulator = ThingsBoardEmulator(args.host, args.port, args.token, args.messages_limit, args.telemetry_limit,
+                                   args.datapoints_limit, args.rate_limit_action, args.ack_delay)
+    emulator.start()
+    print(f"Listening on {args.host}:{emulator.port}, Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(10)
+            print("  ".join(f"{key}={value}" for key, value in emulator.stats.items()))
+    except KeyboardInterrupt:
+        emulator.stop()
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ from enum import Enum, auto
 class PublishType(Enum):
     TELEMETRY = auto()
     ATTRIBUTE = auto()
+    REPORT = auto()
 
 class SeverityLevel(Enum):
     NOTIFICACION = 1
@@ -12,4 +13,9 @@ class SeverityLevel(Enum):
 class PanelModel(Enum):
     EDWARDS_IO1000 = 10001
     EDWARDS_EST3X = 10002
-    NOTIFIER_NFS320 = 10003
\ No newline at end of file
+    NOTIFIER_NFS320 = 10003
+
+class FrameKind(Enum):
+    EVENT = auto()
+    REPORT_ROW = auto()
+    REPORT_END = auto()
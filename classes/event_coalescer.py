@@ -0,0 +1,87 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List
+from classes.enums import SeverityLevel
+from classes.event_record import EventRecord
+
+class _Window:
+    __slots__ = ("deadline", "count", "latest", "last_seen")
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.count = 0
+        self.latest: EventRecord | None = None
+        self.last_seen = 0
+
+class EventCoalescer:
+    # The first occurrence of an (event, description) pair is published right away. Repeats inside
+    # the window are folded into one summary carrying repeat_count, emitted when the window closes.
+    def __init__(self, window: float, max_keys: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock
+        # Windows are kept in opening order, so their deadlines are sorted as well
+        self.windows: "OrderedDict[Hashable, _Window]" = OrderedDict()
+        self.stats: Dict[str, int] = {"passed": 0, "suppressed": 0, "summaries": 0}
+        self._sequence = 0
+
+    def offer(self, event: EventRecord) -> List[EventRecord]:
+        if self.window <= 0 or event.get("severity") == SeverityLevel.SEVERO.value:
+            self.stats["passed"] += 1
+            return [event]
+
+        now = self.clock()
+        ready = self.expire(now)
+        key = (event.get("event"), event.get("description"))
+        window = self.windows.get(key)
+        self._sequence += 1
+        if window is not None:
+            window.count += 1
+            window.latest = event
+            window.last_seen = self._sequence
+            self.stats["suppressed"] += 1
+            return ready
+
+        if len(self.windows) >= self.max_keys:
+            ready.extend(self._close(*self.windows.popitem(last=False), now, reopen=False))
+        self.windows[key] = _Window(now + self.window)
+        self.stats["passed"] += 1
+        ready.append(event)
+        return ready
+
+    def expire(self, now: float | None = None) -> List[EventRecord]:
+        if not self.windows:
+            return []
+        now = self.clock() if now is None else now
+        closed = []
+        while self.windows:
+            key, window = next(iter(self.windows.items()))
+            if window.deadline > now:
+                break
+            del self.windows[key]
+            closed.append((key, window))
+        return self._summaries(closed, now, reopen=True)
+
+    def flush(self) -> List[EventRecord]:
+        closed = list(self.windows.items())
+        self.windows.clear()
+        return self._summaries(closed, self.clock(), reopen=False)
+
+    def _summaries(self, closed: List[tuple], now: float, reopen: bool) -> List[EventRecord]:
+        # Emit in order of last occurrence so the final state of a flapping device is sent last
+        closed.sort(key=lambda entry: entry[1].last_seen)
+        summaries = []
+        for key, window in closed:
+            summaries.extend(self._close(key, window, now, reopen))
+        return summaries
+
+    def _close(self, key: Hashable, window: _Window, now: float, reopen: bool) -> List[EventRecord]:
+        if window.count == 0:
+            return []
+        if reopen:
+            # Keep folding an ongoing storm into one summary per window
+            self.windows[key] = _Window(now + self.window)
+        summary = window.latest
+        summary["repeat_count"] = window.count
+        self.stats["summaries"] += 1
+        return [summary]
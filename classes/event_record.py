@@ -0,0 +1,93 @@
+import struct
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+SBC_DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# timestamp, severity, repeat_count (0 = none), then the lengths of event, description, FACP_date and device
+_RECORD_HEADER = struct.Struct('<dbIHIHH')
+
+class EventRecord:
+    # A parsed panel event. Replaces the per-event dict: slots instead of a hash table, the SBC date
+    # kept as an epoch float and formatted only at publish time, and event IDs interned.
+    # get/in/item assignment/update keep it usable where queued messages are handled as mappings.
+    __slots__ = ("event", "description", "severity", "timestamp", "FACP_date", "repeat_count", "device")
+
+    def __init__(self, event: str, description: str, severity: int, FACP_date: str = "",
+                 timestamp: float | None = None, repeat_count: int | None = None, device: str | None = None):
+        self.event = sys.intern(event)
+        self.description = description
+        self.severity = severity
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.FACP_date = FACP_date
+        self.repeat_count = repeat_count
+        self.device = device
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "SBC_date":
+            return self.sbc_date()
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def __contains__(self, key: str) -> bool:
+        return key == "SBC_date" or (key in self.__slots__ and getattr(self, key) is not None)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def update(self, other: "EventRecord") -> None:
+        for key in self.__slots__:
+            setattr(self, key, getattr(other, key))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, EventRecord):
+            return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"EventRecord({self.to_telemetry()})"
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return (EventRecord.from_bytes, (self.to_bytes(),))
+
+    def sbc_date(self) -> str:
+        return datetime.fromtimestamp(self.timestamp).strftime(SBC_DATE_FORMAT)
+
+    def timestamp_ms(self) -> int:
+        return int(self.timestamp * 1000)
+
+    def to_telemetry(self) -> Dict[str, Any]:
+        telemetry = {
+            "event": self.event,
+            "description": self.description,
+            "severity": self.severity,
+            "SBC_date": self.sbc_date(),
+            "FACP_date": self.FACP_date
+        }
+        if self.repeat_count is not None:
+            telemetry["repeat_count"] = self.repeat_count
+        return telemetry
+
+    def to_bytes(self) -> bytes:
+        event = self.event.encode("utf-8")
+        description = self.description.encode("utf-8")
+        facp_date = self.FACP_date.encode("utf-8")
+        device = (self.device or "").encode("utf-8")
+        header = _RECORD_HEADER.pack(self.timestamp, self.severity, self.repeat_count or 0,
+                                     len(event), len(description), len(facp_date), len(device))
+        return b"".join((header, event, description, facp_date, device))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "EventRecord":
+        timestamp, severity, repeat_count, event_len, description_len, facp_len, device_len = _RECORD_HEADER.unpack_from(data)
+        position = _RECORD_HEADER.size
+        fields = []
+        for length in (event_len, description_len, facp_len, device_len):
+            fields.append(data[position:position + length].decode("utf-8"))
+            position += length
+        event, description, facp_date, device = fields
+        return cls(event, description, severity, facp_date, timestamp, repeat_count or None, device or None)
@@ -0,0 +1,224 @@
+import re
+import time
+import logging
+from dataclasses import dataclass
+from typing import Callable, List, Pattern, Tuple
+from classes.enums import FrameKind
+
+logger = logging.getLogger(__name__)
+
+Frame = Tuple[FrameKind, str]
+
+@dataclass(frozen=True)
+class FramingRules:
+    line_terminator: bytes = b"\n"
+    # A frame with max_report_delimiter_count delimiter lines is a report, one with none is an event.
+    # Report lines are streamed as REPORT_ROW frames from the first delimiter on, then a REPORT_END closes it
+    report_delimiter: bytes = b""
+    max_report_delimiter_count: int = -1
+    # When set, reports only end on a blank line if their last line contains the marker
+    end_report_marker: bytes = b""
+    # Every line closes the frame, as if the panel had printed a blank line after it
+    line_is_frame: bool = False
+    # When set, each line holds one or more events starting at these timestamps
+    timestamp_boundary: Pattern[bytes] | None = None
+    timestamp_separator: bytes = b"\r"
+    # A line left without terminator for this long is processed as complete
+    partial_line_timeout: float = 1
+    encoding: str = "latin-1"
+
+# Read buffer of each framer, grown only for a line longer than half of it
+READ_BUFFER_SIZE = 4096
+# bytes.strip() whitespace, str.strip() would also take \x1c-\x1f, \x85 and \xa0
+_WHITESPACE = " \t\n\r\x0b\x0c"
+
+class Framer:
+    def __init__(self, rules: FramingRules, buffer_size: int = READ_BUFFER_SIZE):
+        self.rules = rules
+        encoding = rules.encoding
+        self._report_delimiter = rules.report_delimiter.decode(encoding)
+        self._end_report_marker = rules.end_report_marker.decode(encoding)
+        self._separator = rules.timestamp_separator.decode(encoding)
+        self._timestamp_boundary = None if rules.timestamp_boundary is None else re.compile(
+            rules.timestamp_boundary.pattern.decode(encoding), rules.timestamp_boundary.flags | re.ASCII)
+        # Unframed bytes are _buffer[_start:_end], each complete line is decoded once straight from it
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._scan_from = 0
+        self._lines: List[str] = []
+        self._has_content = False
+        self._report_count = 0
+        self._in_report = False
+        self._last_line = ""
+        self._last_feed = time.monotonic()
+
+    def feed(self, data: bytes) -> List[Frame]:
+        self._reserve(len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._end += len(data)
+        self._last_feed = time.monotonic()
+        return self.take_frames()
+
+    def read_from(self, read_into: Callable[[memoryview], int], size: int) -> memoryview:
+        # Reads up to size bytes with read_into directly into the buffer. The returned view of the new
+        # bytes is only valid until the next read
+        size = max(1, min(size, len(self._buffer) // 2))
+        self._reserve(size)
+        count = read_into(self._view[self._end:self._end + size]) or 0
+        data = self._view[self._end:self._end + count]
+        self._end += count
+        self._last_feed = time.monotonic()
+        return data
+
+    def take_frames(self) -> List[Frame]:
+        frames: List[Frame] = []
+        buffer = self._buffer
+        view = self._view
+        encoding = self.rules.encoding
+        process_line = self._process_line
+        terminator = self.rules.line_terminator
+        start = self._start
+        end = buffer.find(terminator, self._scan_from, self._end)
+        while end >= 0:
+            process_line(str(view[start:end], encoding).strip(_WHITESPACE), frames)
+            start = end + len(terminator)
+            end = buffer.find(terminator, start, self._end)
+        if start == self._end:
+            # Nothing left over, the next read starts at the front again
+            start = self._end = 0
+        self._start = start
+        self._scan_from = max(start, self._end - len(terminator) + 1)
+        return frames
+
+    def poll_idle(self) -> List[Frame]:
+        frames: List[Frame] = []
+        if self._end > self._start and time.monotonic() - self._last_feed >= self.rules.partial_line_timeout:
+            self._flush_pending_line(frames)
+        return frames
+
+    def flush(self) -> List[Frame]:
+        frames: List[Frame] = []
+        self._flush_pending_line(frames)
+        if self._in_report:
+            frames.append((FrameKind.REPORT_END, ""))
+            self._reset_frame()
+        elif self._has_content:
+            self._emit(FrameKind.EVENT, frames)
+        return frames
+
+    def _reserve(self, size: int) -> None:
+        if len(self._buffer) - self._end >= size:
+            return
+        pending = self._end - self._start
+        if pending <= self._start and len(self._buffer) - pending >= size:
+            # The partial line moves to the front, both ranges do not overlap
+            self._buffer[:pending] = self._view[self._start:self._end]
+        else:
+            buffer = bytearray(max(len(self._buffer) * 2, pending + size))
+            buffer[:pending] = self._view[self._start:self._end]
+            self._view.release()
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+        self._scan_from -= self._start
+        self._start = 0
+        self._end = pending
+
+    def _flush_pending_line(self, frames: List[Frame]) -> None:
+        line = str(self._view[self._start:self._end], self.rules.encoding).strip(_WHITESPACE)
+        self._start = self._end = self._scan_from = 0
+        self._process_line(line, frames)
+
+    def _process_line(self, line: str, frames: List[Frame]) -> None:
+        rules = self.rules
+        if self._timestamp_boundary is not None:
+            self._split_timestamped(line, frames)
+            return
+
+        if line:
+            is_delimiter = bool(self._report_delimiter) and self._report_delimiter in line
+            if is_delimiter:
+                self._report_count += 1
+            if self._report_count:
+                self._report_line(line, is_delimiter, frames)
+                if rules.line_is_frame:
+                    self._end_of_frame(frames)
+                return
+            self._lines.append(line)
+            self._has_content = True
+            if rules.line_is_frame:
+                self._end_of_frame(frames)
+        elif rules.line_is_frame:
+            if self._has_content and not self._in_report:
+                self._lines.append("")
+            self._end_of_frame(frames)
+        else:
+            self._end_of_frame(frames)
+
+    def _report_line(self, line: str, is_delimiter: bool, frames: List[Frame]) -> None:
+        if not self._in_report:
+            # Lines buffered before the first delimiter belong to the report header
+            self._in_report = True
+            for buffered in self._lines:
+                if buffered:
+                    frames.append((FrameKind.REPORT_ROW, buffered))
+            self._lines = []
+        if not is_delimiter:
+            frames.append((FrameKind.REPORT_ROW, line))
+        self._last_line = line
+        self._has_content = True
+
+    def _end_of_frame(self, frames: List[Frame]) -> None:
+        if not self._has_content:
+            self._reset_frame()
+            return
+
+        rules = self.rules
+        count = self._report_count
+        marker = self._end_report_marker
+        if self._in_report:
+            # Incomplete reports keep streaming until the closing delimiter shows up
+            if count == rules.max_report_delimiter_count and (not marker or marker in self._last_line):
+                frames.append((FrameKind.REPORT_END, ""))
+                self._reset_frame()
+        elif marker and marker in self._lines[-1]:
+            logger.debug("Empty report parsed. Skipping.")
+            self._reset_frame()
+        else:
+            self._emit(FrameKind.EVENT, frames)
+
+    def _split_timestamped(self, line: str, frames: List[Frame]) -> None:
+        if not line or line == "\x00":
+            return
+        rules = self.rules
+        if self._report_delimiter and self._report_delimiter in line:
+            self._report_count += 1
+            self._in_report = True
+            if self._report_count >= rules.max_report_delimiter_count:
+                frames.append((FrameKind.REPORT_END, ""))
+                self._reset_frame()
+            return
+
+        kind = FrameKind.REPORT_ROW if self._in_report else FrameKind.EVENT
+        starts = [match.start() for match in self._timestamp_boundary.finditer(line)]
+        if not starts or starts[0] != 0:
+            starts.insert(0, 0)
+        starts.append(len(line))
+
+        for begin, end in zip(starts, starts[1:]):
+            parts = line[begin:end].strip(_WHITESPACE).split(self._separator, 1)
+            if len(parts) == 2:
+                frames.append((kind, f"{parts[0].strip(_WHITESPACE)}\n{parts[1].strip(_WHITESPACE)}"))
+
+    def _emit(self, kind: FrameKind, frames: List[Frame]) -> None:
+        self._lines.append("")
+        frames.append((kind, "\n".join(self._lines)))
+        self._reset_frame()
+
+    def _reset_frame(self) -> None:
+        self._lines = []
+        self._has_content = False
+        self._report_count = 0
+        self._in_report = False
+        self._last_line = ""
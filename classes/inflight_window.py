@@ -0,0 +1,143 @@
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+# PUBACKs that arrive before the publish call returned are kept this long waiting to be matched
+EARLY_ACK_TTL = 30
+EARLY_ACK_MAX = 1024
+
+class _Entry:
+    __slots__ = ("mids", "on_delivered", "on_failed", "sent_at", "rejected")
+
+    def __init__(self, mids: List[int], on_delivered: Callable[[], None] | None, on_failed: Callable[[], None] | None, sent_at: float):
+        self.mids = set(mids)
+        self.on_delivered = on_delivered
+        self.on_failed = on_failed
+        self.sent_at = sent_at
+        self.rejected = False
+
+class InFlightWindow:
+    # Tracks QoS1 publishes until the broker's PUBACK. on_publish runs on the paho network thread and only
+    # records outcomes, the callbacks run from reap() on the sender thread. A publish that is rejected, times
+    # out or is still open when the connection drops counts as failed (the ThingsBoard client discards its
+    # unacknowledged messages on disconnect, so nothing is resent by paho itself).
+    def __init__(self, size: int, timeout: float = 30):
+        self.size = size
+        self.timeout = timeout
+        self.entries: Dict[int, _Entry] = {}
+        self.by_mid: Dict[int, int] = {}
+        self.early_acks: Dict[int, Tuple[bool, float]] = {}
+        self.completed: List[Tuple[_Entry, bool]] = []
+        self.stats: Dict[str, int] = {"delivered": 0, "failed": 0, "rejected": 0, "timed_out": 0}
+        self.changed = threading.Condition()
+        self._ids = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def full(self) -> bool:
+        return len(self.entries) >= self.size
+
+    def track(self, publish_info: Any, on_delivered: Callable[[], None] | None, on_failed: Callable[[], None] | None,
+              sent_at: float) -> None:
+        # sent_at: time.monotonic() taken before the publish call, older early acks belong to an earlier mid
+        infos = publish_info.message_info if isinstance(publish_info.message_info, list) else [publish_info.message_info]
+        if not infos or any(info.mid is None or info.rc != 0 for info in infos):
+            # Never queued by paho (not connected, queue full, timed out waiting for the rate limit)
+            self._fail(on_failed)
+            return
+        entry = _Entry([info.mid for info in infos], on_delivered, on_failed, sent_at)
+        with self.changed:
+            entry_id = next(self._ids)
+            for mid in list(entry.mids):
+                early = self.early_acks.pop(mid, None)
+                if early is not None and early[1] >= sent_at:
+                    entry.mids.discard(mid)
+                    entry.rejected |= early[0]
+                else:
+                    self.by_mid[mid] = entry_id
+            if entry.mids:
+                self.entries[entry_id] = entry
+            else:
+                self._complete(entry)
+
+    def on_publish(self, mid: int, rejected: bool) -> None:
+        with self.changed:
+            entry_id = self.by_mid.pop(mid, None)
+            entry = self.entries.get(entry_id) if entry_id is not None else None
+            if entry is None:
+                self._remember_early_ack(mid, rejected)
+                return
+            entry.mids.discard(mid)
+            entry.rejected |= rejected
+            if not entry.mids:
+                del self.entries[entry_id]
+                self._complete(entry)
+
+    def fail_all(self) -> None:
+        # The connection dropped, nothing still open will be acknowledged anymore
+        with self.changed:
+            for entry in self.entries.values():
+                self.completed.append((entry, False))
+            self.entries.clear()
+            self.by_mid.clear()
+            self.early_acks.clear()
+            self.changed.notify_all()
+
+    def reap(self) -> int:
+        # Runs the callbacks of finished publishes, returns how many failed
+        now = time.monotonic()
+        with self.changed:
+            for entry_id, entry in list(self.entries.items()):
+                if now - entry.sent_at < self.timeout:
+                    # Entries are kept in send order, the rest are younger
+                    break
+                del self.entries[entry_id]
+                for mid in entry.mids:
+                    self.by_mid.pop(mid, None)
+                self.stats["timed_out"] += 1
+                self.completed.append((entry, False))
+            if not self.completed:
+                return 0
+            completed, self.completed = self.completed, []
+
+        failed = 0
+        for entry, delivered in completed:
+            if delivered:
+                self.stats["delivered"] += 1
+                if entry.on_delivered is not None:
+                    entry.on_delivered()
+            else:
+                failed += 1
+                self._fail(entry.on_failed)
+        return failed
+
+    def wait(self, timeout: float) -> bool:
+        # Until there is room in the window or something to reap
+        with self.changed:
+            return self.changed.wait_for(lambda: self.completed or not self.full(), timeout)
+
+    def wait_until_empty(self, timeout: float) -> bool:
+        with self.changed:
+            return self.changed.wait_for(lambda: not self.entries, timeout)
+
+    def _fail(self, on_failed: Callable[[], None] | None) -> None:
+        self.stats["failed"] += 1
+        if on_failed is not None:
+            on_failed()
+
+    def _complete(self, entry: _Entry) -> None:
+        if entry.rejected:
+            self.stats["rejected"] += 1
+        self.completed.append((entry, not entry.rejected))
+        self.changed.notify_all()
+
+    def _remember_early_ack(self, mid: int, rejected: bool) -> None:
+        now = time.monotonic()
+        if len(self.early_acks) >= EARLY_ACK_MAX:
+            # Mostly PUBACKs of publishes that are not tracked (gateway device connects, attribute requests)
+            self.early_acks = {key: value for key, value in self.early_acks.items() if now - value[1] < EARLY_ACK_TTL}
+            if len(self.early_acks) >= EARLY_ACK_MAX:
+                self.early_acks.clear()
+        self.early_acks[mid] = (rejected, now)
@@ -1,113 +1,498 @@
 from tb_device_mqtt import TBDeviceMqttClient
-from app_utils.queue_operations import SafeQueue
+from tb_gateway_mqtt import TBGatewayMqttClient
+from app_utils.queue_operations import SafeQueue, DEVICE_KEY
 import logging
-from typing import Dict, Any, Callable
+from typing import Dict, Any, Callable, List, Tuple
+from datetime import datetime
 import threading
+import asyncio
+import random
 import time
 from classes.enums import PublishType
+from classes.event_record import EventRecord, SBC_DATE_FORMAT
+from classes.telemetry_encoding import TelemetryEncoder
+from classes.inflight_window import InFlightWindow
 from config.schema import ConfigSchema
+from app_utils.metrics import REGISTRY, MetricsRegistry
 import queue
-from collections import deque
 
-class APILimitsManager:
-    def __init__(self):
-        self.second_limit = 100
-        self.minute_limit = 3000
-        self.hour_limit = 7000
-        self.second_window = deque()
-        self.minute_window = deque()
-        self.hour_window = deque()
-
-    def can_send(self) -> bool:
-        current_time = time.time()
-        self._update_windows(current_time)
-        
-        if (len(self.second_window) < self.second_limit and
-            len(self.minute_window) < self.minute_limit and
-            len(self.hour_window) < self.hour_limit):
-            self._add_request(current_time)
-            return True
-        return False
+RATE_LIMIT_REJECTIONS = REGISTRY.counter("facp_rate_limit_rejections_total", "Sends held back by the ThingsBoard rate limiter").labels()
+MESSAGES_SENT = REGISTRY.counter("facp_mqtt_messages_sent_total", "Messages handed to the MQTT client", ["type"])
+PUBLISH_FAILURES = REGISTRY.counter("facp_mqtt_publish_failures_total", "Publishes that raised and were re-queued or dropped", ["type"])
+MQTT_DISCONNECTS = REGISTRY.counter("facp_mqtt_disconnects_total", "ThingsBoard connections lost").labels()
+PUBLISH_SECONDS = REGISTRY.histogram("facp_mqtt_publish_seconds", "Time spent in one MQTT client publish call").labels()
+EVENT_LATENCY = REGISTRY.histogram("facp_event_publish_latency_seconds", "Time from reading a panel event to publishing it").labels()
+# Message key carrying the time a queued state was observed (ms), sent as its ThingsBoard ts
+TS_KEY = "ts"
+
+REDELIVERIES = REGISTRY.counter("facp_mqtt_redelivered_total", "Queued messages put back because ThingsBoard never confirmed them").labels()
+
+class TokenBucket:
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
 
-    def _update_windows(self, current_time: float):
-        self._clean_window(self.second_window, current_time - 1)
-        self._clean_window(self.minute_window, current_time - 60)
-        self._clean_window(self.hour_window, current_time - 3600)
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
 
-    def _clean_window(self, window: deque, oldest_allowed: float):
-        while window and window[0] < oldest_allowed:
-            window.popleft()
+    def time_until_available(self, amount: int = 1) -> float:
+        missing = amount - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
 
-    def _add_request(self, current_time: float):
-        self.second_window.append(current_time)
-        self.minute_window.append(current_time)
-        self.hour_window.append(current_time)
+class APILimitsManager:
+    def __init__(self, limits: str = "100:1,3000:60,7000:3600"):
+        # ThingsBoard rate limit syntax: comma separated <requests>:<seconds> windows
+        self.buckets: List[TokenBucket] = []
+        for window in filter(None, limits.split(',')):
+            capacity, period = window.split(':')
+            self.buckets.append(TokenBucket(int(capacity), float(period)))
+        self.lock = threading.Lock()
+
+    def can_send(self, amount: int = 1) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            for bucket in self.buckets:
+                bucket.refill(now)
+            if any(bucket.tokens < amount for bucket in self.buckets):
+                RATE_LIMIT_REJECTIONS.inc()
+                return False
+            for bucket in self.buckets:
+                bucket.tokens -= amount
+            return True
+
+    def time_until_available(self, amount: int = 1) -> float:
+        with self.lock:
+            now = time.monotonic()
+            wait = 0.0
+            for bucket in self.buckets:
+                bucket.refill(now)
+                wait = max(wait, bucket.time_until_available(amount))
+            return wait
 
 class MqttHandler:
     def __init__(self, config: ConfigSchema, queue: SafeQueue):
         self.config = config
         self.queue = queue
         self.logger = logging.getLogger(__name__)
-        self.reconnect_interval = 5
+        self.reconnect_min_delay = config.mqtt.reconnect_min_delay
+        self.reconnect_max_delay = config.mqtt.reconnect_max_delay
+        self.idle_timeout = 5
         self.device_token = config.thingsboard.device_token
         self.tb_host = config.thingsboard.host
         self.tb_port = config.thingsboard.port
-        self.client: TBDeviceMqttClient = TBDeviceMqttClient(host=self.tb_host, username=self.device_token, port=self.tb_port)
-        self.client.connect()
-        self.api_limits_manager = APILimitsManager()
+        # In gateway mode the token belongs to a ThingsBoard gateway and every panel is routed as its own device
+        self.gateway_devices = {panel.device_name: panel.device_type for panel in config.panels}
+        client_class = TBGatewayMqttClient if config.gateway_mode else TBDeviceMqttClient
+        self.client: TBDeviceMqttClient = client_class(host=self.tb_host, username=self.device_token, port=self.tb_port)
+        self.api_limits_manager = APILimitsManager(config.mqtt.rate_limits)
+        self.batch_size = config.mqtt.batch_size
+        self.batch_linger = config.mqtt.batch_linger
+        self.encoder = TelemetryEncoder(config.mqtt.compress_min_bytes, config.mqtt.compression_level)
+        # With a window queued messages are only acknowledged once ThingsBoard confirms them (QoS1 PUBACK)
+        self.window = InFlightWindow(config.mqtt.inflight_window, config.mqtt.inflight_timeout) if config.mqtt.inflight_window > 0 else None
+        self._redeliveries: List[int] = []
+        self._redeliveries_lock = threading.Lock()
+        # Set when a publish of queued items raised, the drain pauses before sending them again
+        self._publish_failed = False
+        self._drain_thread: threading.Thread | None = None
+        self.shutdown_flag = threading.Event()
+        self.connection_changed = threading.Condition()
+        # Called on the paho thread whenever the link state changes
+        self.connection_listeners: List[Callable[[], None]] = []
+        self.connected = False
+        self._loop_started = False
+        self._reconnect_attempt = 0
+        self._install_connection_callbacks()
         logging.getLogger('tb_connection').setLevel(logging.WARNING)
 
+    def _install_connection_callbacks(self):
+        # Chain onto the paho callbacks the ThingsBoard client installed, so the
+        # drain thread is notified as soon as the link state changes
+        paho_client = self.client._client
+        tb_on_connect = paho_client.on_connect
+        tb_on_disconnect = paho_client.on_disconnect
+        tb_on_publish = paho_client.on_publish
+
+        def on_connect(client, userdata, connect_flags, result_code, properties=None, *extra_params):
+            tb_on_connect(client, userdata, connect_flags, result_code, properties, *extra_params)
+            if result_code == 0:
+                self._set_connected(True)
+
+        def on_disconnect(client, userdata, disconnect_flags, reason=None, properties=None):
+            tb_on_disconnect(client, userdata, disconnect_flags, reason, properties)
+            self._set_connected(False)
+            self._schedule_reconnect()
+
+        def on_connect_fail(client, userdata):
+            self._schedule_reconnect()
+
+        def on_publish(client, userdata, mid, reason_code=None, properties=None):
+            tb_on_publish(client, userdata, mid, reason_code, properties)
+            if self.window is not None:
+                self.window.on_publish(mid, reason_code is not None and reason_code.is_failure)
+
+        paho_client.on_connect = on_connect
+        paho_client.on_disconnect = on_disconnect
+        paho_client.on_connect_fail = on_connect_fail
+        paho_client.on_publish = on_publish
+
+    def _set_connected(self, connected: bool):
+        if not connected and self.window is not None:
+            # The ThingsBoard client drops unconfirmed messages on disconnect, the sender puts them back in the queue
+            self.window.fail_all()
+        with self.connection_changed:
+            self.connected = connected
+            self.connection_changed.notify_all()
+        for listener in self.connection_listeners:
+            listener()
+        if connected:
+            self._reconnect_attempt = 0
+            self.logger.info("Connected to ThingsBoard")
+            self._connect_gateway_devices()
+        else:
+            MQTT_DISCONNECTS.inc()
+            self.logger.warning("Disconnected from ThingsBoard")
+
+    def _connect_gateway_devices(self):
+        for device_name, device_type in self.gateway_devices.items():
+            try:
+                self.client.gw_connect_device(device_name, device_type)
+            except Exception as e:
+                self.logger.error(f"Failed to connect gateway device {device_name}: {e}")
+
+    def _split_device(self, message: Dict[str, Any] | EventRecord) -> Tuple[str | None, Dict[str, Any]]:
+        if isinstance(message, EventRecord):
+            return message.device, message.to_telemetry()
+        device = message.get(DEVICE_KEY)
+        if device is None:
+            return None, message
+        return device, {key: value for key, value in message.items() if key != DEVICE_KEY}
+
+    def _split_timestamp(self, values: Dict[str, Any]) -> Tuple[int | None, Dict[str, Any]]:
+        if TS_KEY not in values:
+            return None, values
+        return values[TS_KEY], {key: value for key, value in values.items() if key != TS_KEY}
+
+    def _send_telemetry(self, device: str | None, payload: Any) -> Any:
+        start = time.perf_counter()
+        if device is None:
+            publish_info = self.client.send_telemetry(payload)
+        else:
+            publish_info = self.client.gw_send_telemetry(device, payload)
+        PUBLISH_SECONDS.observe(time.perf_counter() - start)
+        return publish_info
+
+    def _observe_sent(self, messages: List[Any]):
+        now = time.time()
+        for message in messages:
+            if isinstance(message, EventRecord):
+                EVENT_LATENCY.observe(now - message.timestamp)
+        MESSAGES_SENT.labels("telemetry").inc(len(messages))
+
+    def register_metrics(self, registry: MetricsRegistry):
+        registry.gauge("facp_mqtt_connected", "1 while connected to ThingsBoard").set_function(lambda: int(self.connected))
+        registry.counter("facp_mqtt_telemetry_bytes_total", "Telemetry bytes sent, after delta encoding and compression").set_function(
+            lambda: self.encoder.stats["sent_bytes"])
+        registry.gauge("facp_mqtt_bytes_per_event", "Average telemetry bytes sent per panel event").set_function(self.encoder.bytes_per_event)
+        if self.window is not None:
+            registry.gauge("facp_mqtt_inflight", "Publishes waiting for a PUBACK").set_function(lambda: len(self.window))
+
+    def _send_attributes(self, device: str | None, attributes: Dict[str, Any]) -> Any:
+        if device is None:
+            return self.client.send_attributes(attributes)
+        return self.client.gw_send_attributes(device, attributes)
+
+    def _track(self, publish_info: Any, sent_at: float, sources: List[int] | None,
+               on_failed: Callable[[], None], on_delivered: Callable[[], None] | None = None) -> bool:
+        # Without a window a publish call that did not raise counts as delivered. With one, the queue items a
+        # publish came from (sources, by queue ticket) are acked on PUBACK and put back in front of the queue if
+        # it never comes; on_failed handles messages that were published directly, on_delivered runs on PUBACK.
+        # Returns True when the sources were taken over
+        if self.window is None:
+            return False
+        if sources:
+            self.window.track(publish_info, lambda: self._ack_sources(sources, on_delivered), lambda: self._redeliver(sources), sent_at)
+            if self._redeliveries:
+                # Not even handed to paho, e.g. the connection dropped during the call
+                self._settle_in_flight()
+        else:
+            self.window.track(publish_info, on_delivered, on_failed, sent_at)
+        return True
+
+    def _ack_sources(self, sources: List[int], on_delivered: Callable[[], None] | None = None):
+        for ticket in sources:
+            self.queue.ack(ticket)
+        if on_delivered is not None:
+            on_delivered()
+
+    def _redeliver(self, sources: List[int]):
+        # Collected and put back in one go, so they keep their order in front of the queue
+        with self._redeliveries_lock:
+            self._redeliveries.extend(sources)
+
+    def _settle_in_flight(self) -> int:
+        if self.window is None:
+            return 0
+        failed = self.window.reap()
+        if failed:
+            self.logger.warning("%d publishes were not confirmed by ThingsBoard", failed)
+        with self._redeliveries_lock:
+            redeliveries, self._redeliveries = self._redeliveries, []
+        if redeliveries:
+            REDELIVERIES.inc(len(redeliveries))
+            self.queue.requeue(redeliveries)
+        return failed
+
+    def _get_timeout(self) -> float:
+        # Poll more often while publishes wait for their PUBACK, so they are settled promptly
+        return 0.05 if self.window is not None and len(self.window) else self.idle_timeout
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def wait_until_connected(self, timeout: float) -> bool:
+        with self.connection_changed:
+            self.connection_changed.wait_for(lambda: self.connected or self.shutdown_flag.is_set(), timeout)
+            return self.connected
+
     def connect(self):
         try:
-            self.client.connect()
+            self.client.connect(min_reconnect_delay=self.reconnect_min_delay, timeout=self.reconnect_max_delay)
+            # From here on the paho network loop retries the connection by itself
+            self._loop_started = True
 
         except Exception as e:
             self.logger.error(f"Failed to connect to ThingsBoard: {e}")
 
-    def publish_telemetry(self, telemetry: Dict[str, Any], bypass_queue: bool = False):
-        if not self.client.is_connected:
+    def _reconnect_delay(self) -> float:
+        delay = min(self.reconnect_max_delay, self.reconnect_min_delay * (2 ** self._reconnect_attempt))
+        self._reconnect_attempt += 1
+        return random.uniform(delay / 2, delay)
+
+    def _schedule_reconnect(self):
+        # Runs on the paho thread right before its network loop waits to reconnect. paho would double a
+        # fixed delay, pinning its bounds to the jittered one makes that wait the next backoff step, so
+        # gateways dropped by the same outage do not reconnect in lockstep
+        if not self.shutdown_flag.is_set():
+            delay = self._reconnect_delay()
+            self.client.reconnect_delay_set(delay, delay)
+
+    def _connection_wait(self) -> float:
+        # Once the network loop runs it reconnects by itself, until then the drain retries connect()
+        return self.reconnect_max_delay if self._loop_started else self._reconnect_delay()
+
+    def _connection_timed_out(self, waited: float):
+        if self._loop_started:
+            self.logger.warning("Still waiting for the ThingsBoard connection after %.1f seconds", waited)
+        else:
+            self.logger.warning("Not connected to ThingsBoard. Attempting to reconnect...")
+
+    def _wait_for_connection(self):
+        delay = self._connection_wait()
+        if self.wait_until_connected(delay) or self.shutdown_flag.is_set():
+            return
+        self._connection_timed_out(delay)
+        if not self._loop_started:
+            self.connect()
+
+    def publish_telemetry(self, telemetry: Dict[str, Any], bypass_queue: bool = False, delta: bool = False,
+                          source: int | None = None) -> bool:
+        # delta: state telemetry, only the keys changed since the last accepted values are sent
+        # source: the queue ticket the telemetry was taken with, True is returned if it was handed back to the
+        # queue or taken over by the in-flight window
+        if not self.is_connected():
             if bypass_queue:
                 self.logger.warning("Not connected to ThingsBoard. Dropping telemetry.")
-                return
+                return False
             else:
                 self.logger.warning("Not connected to ThingsBoard. Queueing telemetry.")
-                self.queue.put((PublishType.TELEMETRY, telemetry))
-                return
+                return self._queue_telemetry(telemetry, delta, source)
 
         if not self.api_limits_manager.can_send():
             if bypass_queue:
                 self.logger.warning("API rate limit reached. Dropping telemetry.")
-                return
+                return False
             else:
                 self.logger.warning("API rate limit reached. Queueing telemetry.")
-                self.queue.put((PublishType.TELEMETRY, telemetry))
-                return
+                return self._queue_telemetry(telemetry, delta, source)
 
+        device, values = self._split_device(telemetry)
+        ts, values = self._split_timestamp(values)
+        payload = self.encoder.delta(device, values) if delta else values
+        if not payload:
+            self.logger.debug("Telemetry unchanged since the last accepted values, nothing to send: %s", telemetry)
+            return False
         try:
-            self.client.send_telemetry(telemetry)
-            self.logger.debug(f"Telemetry sent successfully: {telemetry}")
+            sent_at = time.monotonic()
+            if ts is not None:
+                payload = {"ts": ts, "values": payload}
+            publish_info = self._send_telemetry(device, self.encoder.encode(payload, panel_events=int(isinstance(telemetry, EventRecord))))
+            self._observe_sent([telemetry])
+            acknowledge = None
+            if delta:
+                # With a window the delta baseline only moves once ThingsBoard confirms the values
+                acknowledge = lambda: self.encoder.acknowledge(device, values)
+                if self.window is None:
+                    acknowledge()
+            self.logger.debug("Telemetry sent successfully: %s", payload)
+            return self._track(publish_info, sent_at, [source] if source is not None else None,
+                               lambda: self._telemetry_not_confirmed(telemetry, bypass_queue, delta), acknowledge)
         except Exception as e:
+            PUBLISH_FAILURES.labels("telemetry").inc()
             self.logger.error(f"Failed to publish telemetry: {e}")
             if not bypass_queue:
-                self.queue.put((PublishType.TELEMETRY, telemetry))
+                return self._queue_telemetry(telemetry, delta, source, failed=True)
+        return False
 
-    def publish_attributes(self, attributes: Dict[str, Any]):
-        if not self.client.is_connected:
-            self.logger.warning("Not connected to ThingsBoard. Queueing attributes.")
-            self.queue.put((PublishType.ATTRIBUTE, attributes))
+    def _telemetry_not_confirmed(self, telemetry: Dict[str, Any], bypass_queue: bool, delta: bool):
+        if not bypass_queue:
+            self._queue_telemetry(telemetry, delta)
             return
+        if delta:
+            self.encoder.invalidate(self._split_device(telemetry)[0])
+        self.logger.warning("Telemetry was not confirmed by ThingsBoard. Dropping it.")
+
+    def _queue_telemetry(self, telemetry: Dict[str, Any], delta: bool, source: int | None = None, failed: bool = False) -> bool:
+        # Queued state is sent in full later, the acknowledged values no longer describe what ThingsBoard has
+        if delta:
+            self.encoder.invalidate(self._split_device(telemetry)[0])
+        return self._retry_later((PublishType.TELEMETRY, telemetry), [source] if source is not None else None, failed)
+
+    def _retry_later(self, item: Tuple[PublishType, Any], sources: List[int] | None, failed: bool = False) -> bool:
+        # Taken items go back in front of their lanes under their tickets, so they keep their order and journal
+        # entries; messages published directly are queued as new items. Returns True when tickets were handed back
+        if not sources:
+            self.queue.put(item)
+            return False
+        self._hand_back(sources, failed)
+        return True
+
+    def _hand_back(self, sources: List[int], failed: bool):
+        self.queue.requeue(sources)
+        if failed:
+            self._publish_failed = True
+
+    def publish_attributes(self, attributes: Dict[str, Any], source: int | None = None) -> bool:
+        sources = [source] if source is not None else None
+        if not self.is_connected():
+            self.logger.warning("Not connected to ThingsBoard. Queueing attributes.")
+            return self._retry_later((PublishType.ATTRIBUTE, attributes), sources)
 
         if not self.api_limits_manager.can_send():
             self.logger.warning("API rate limit reached. Queueing attributes.")
-            self.queue.put((PublishType.ATTRIBUTE, attributes))
-            return
+            return self._retry_later((PublishType.ATTRIBUTE, attributes), sources)
 
         try:
-            self.client.send_attributes(attributes)
-            self.logger.debug(f"Attributes sent successfully: {attributes}")
+            sent_at = time.monotonic()
+            publish_info = self._send_attributes(*self._split_device(attributes))
+            MESSAGES_SENT.labels("attributes").inc()
+            self.logger.debug("Attributes sent successfully: %s", attributes)
+            return self._track(publish_info, sent_at, sources, lambda: self.queue.put((PublishType.ATTRIBUTE, attributes)))
         except Exception as e:
+            PUBLISH_FAILURES.labels("attributes").inc()
             self.logger.error(f"Failed to publish attributes: {e}")
-            self.queue.put((PublishType.ATTRIBUTE, attributes))
+            return self._retry_later((PublishType.ATTRIBUTE, attributes), sources, failed=True)
+
+    def publish_report_chunk(self, chunk: Dict[str, Any], source: int | None = None) -> bool:
+        sources = [source] if source is not None else None
+        if not self.is_connected():
+            self.logger.warning("Not connected to ThingsBoard. Queueing report chunk.")
+            return self._retry_later((PublishType.REPORT, chunk), sources)
+
+        if not self.api_limits_manager.can_send():
+            self.logger.warning("API rate limit reached. Queueing report chunk.")
+            return self._retry_later((PublishType.REPORT, chunk), sources)
+
+        try:
+            # Chunks of one report share its start time, offset them so ThingsBoard keeps every one
+            device, values = self._split_device(chunk)
+            sent_at = time.monotonic()
+            publish_info = self._send_telemetry(device, {"ts": chunk["report_id"] + chunk["report_chunk"], "values": values})
+            MESSAGES_SENT.labels("report").inc()
+            self.logger.debug("Report %s chunk %s sent successfully", chunk['report_id'], chunk['report_chunk'])
+            return self._track(publish_info, sent_at, sources, lambda: self.queue.put((PublishType.REPORT, chunk)))
+        except Exception as e:
+            PUBLISH_FAILURES.labels("report").inc()
+            self.logger.error(f"Failed to publish report chunk: {e}")
+            return self._retry_later((PublishType.REPORT, chunk), sources, failed=True)
+
+    def publish_telemetry_batch(self, batch: List[Dict[str, Any]],
+                                sources: List[int] | None = None) -> List[int]:
+        # sources: the queue tickets of the batch, in order. Returns the ones handed back to the queue or taken
+        # over by the in-flight window
+        if not self.is_connected():
+            self.logger.warning("Not connected to ThingsBoard. Queueing %d telemetry messages.", len(batch))
+            return self._requeue_telemetry(batch, sources)
+
+        # One message per device in the batch
+        groups: Dict[str | None, List[int]] = {}
+        for index, telemetry in enumerate(batch):
+            groups.setdefault(telemetry.get(DEVICE_KEY), []).append(index)
+
+        taken_over: List[int] = []
+        unsent: List[int] = []
+        for device, indexes in groups.items():
+            # Each device message takes its own token, the groups that do not fit go back to the queue
+            if unsent or not self.api_limits_manager.can_send():
+                unsent.extend(indexes)
+                continue
+            group = [batch[index] for index in indexes]
+            group_sources = [sources[index] for index in indexes] if sources else None
+            try:
+                sent_at = time.monotonic()
+                panel_events = sum(isinstance(telemetry, EventRecord) for telemetry in group)
+                payload = self.encoder.encode(self._build_timestamped_payload(group), len(group), panel_events)
+                publish_info = self._send_telemetry(device, payload)
+                self._observe_sent(group)
+                self.logger.debug("Telemetry batch of %d messages sent successfully", len(group))
+                if self._track(publish_info, sent_at, group_sources, lambda group=group: self._requeue_telemetry(group)) and group_sources:
+                    taken_over.extend(group_sources)
+            except Exception as e:
+                PUBLISH_FAILURES.labels("telemetry").inc()
+                self.logger.error(f"Failed to publish telemetry batch: {e}")
+                taken_over.extend(self._requeue_telemetry(group, group_sources, failed=True))
+        if unsent:
+            self.logger.warning("API rate limit reached. Queueing %d telemetry messages.", len(unsent))
+            unsent.sort()
+            taken_over.extend(self._requeue_telemetry([batch[index] for index in unsent],
+                                                      [sources[index] for index in unsent] if sources else None))
+        return taken_over
+
+    def _requeue_telemetry(self, batch: List[Dict[str, Any]], sources: List[int] | None = None, failed: bool = False) -> List[int]:
+        if sources:
+            self._hand_back(sources, failed)
+            return sources
+        for telemetry in batch:
+            self.queue.put((PublishType.TELEMETRY, telemetry))
+        return []
+
+    def _build_timestamped_payload(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        payload = []
+        last_ts = 0
+        for telemetry in batch:
+            ts = self._telemetry_timestamp(telemetry)
+            # ThingsBoard merges values sharing a timestamp, keep them strictly increasing
+            if ts <= last_ts:
+                ts = last_ts + 1
+            last_ts = ts
+            payload.append({"ts": ts, "values": self._split_timestamp(self._split_device(telemetry)[1])[1]})
+        return payload
+
+    def _telemetry_timestamp(self, telemetry: Dict[str, Any] | EventRecord) -> int:
+        if isinstance(telemetry, EventRecord):
+            return telemetry.timestamp_ms()
+        if TS_KEY in telemetry:
+            return telemetry[TS_KEY]
+        sbc_date = telemetry.get("SBC_date")
+        if sbc_date:
+            try:
+                return int(datetime.strptime(sbc_date, SBC_DATE_FORMAT).timestamp() * 1000)
+            except (TypeError, ValueError):
+                pass
+        return int(time.time() * 1000)
 
     def subscribe_to_attribute(self, attribute_name: str, callback: Callable):
         self.client.subscribe_to_attribute(attribute_name, callback)
@@ -118,36 +503,213 @@ class MqttHandler:
 
     def process_queue(self):
         while not self.shutdown_flag.is_set():
-            if self.client.is_connected:
-                try:
-                    message_type, message = self.queue.get(block=False)
-                    if self.api_limits_manager.can_send():
-                        if message_type == PublishType.TELEMETRY:
-                            self.publish_telemetry(message)
-                        elif message_type == PublishType.ATTRIBUTE:
-                            self.publish_attributes(message)
-                        else:
-                            self.logger.error(f'PublishType {message_type} is not supported')
-                    else:
-                        self.logger.warning("API rate limit reached. Re-queueing message.")
-                        self.queue.put((message_type, message))
-                    time.sleep(0.1) 
-                except queue.Empty:
-                    time.sleep(1)
+            if not self.is_connected():
+                self._settle_in_flight()
+                self._wait_for_connection()
+                continue
+            if self._publish_failed:
+                # The failed items are back in front of the queue, pause before sending them again
+                self._publish_failed = False
+                self.shutdown_flag.wait(self.reconnect_min_delay)
+                continue
+            if self.window is not None:
+                if self._settle_in_flight() and self.is_connected():
+                    # Rejected by the broker (e.g. rate limited), back off before sending them again
+                    self.shutdown_flag.wait(self.reconnect_min_delay)
+                    continue
+                if self.window.full():
+                    self.window.wait(self.idle_timeout)
+                    continue
+            wait = self.api_limits_manager.time_until_available()
+            if wait > 0:
+                # Sleep exactly until the rate limiter has capacity again
+                self.shutdown_flag.wait(wait)
+                continue
+            try:
+                taken = self.queue.take(timeout=self._get_timeout())
+            except queue.Empty:
+                continue
+            if self.batch_size > 1 and taken[1][0] == PublishType.TELEMETRY:
+                self._process_telemetry_batch(taken)
             else:
-                self.logger.warning("Not connected to ThingsBoard. Attempting to reconnect...")
-                self.connect()
-                time.sleep(self.reconnect_interval)
+                self._process_item(taken)
 
-    def start(self):
+    def _process_item(self, taken: Tuple[int, Tuple[PublishType, Dict[str, Any]]]):
+        # taken: (queue ticket, item) as returned by SafeQueue.take
+        ticket, (message_type, message) = taken
+        taken_over = False
+        try:
+            if message_type == PublishType.TELEMETRY:
+                taken_over = self.publish_telemetry(message, source=ticket)
+            elif message_type == PublishType.ATTRIBUTE:
+                taken_over = self.publish_attributes(message, source=ticket)
+            elif message_type == PublishType.REPORT:
+                taken_over = self.publish_report_chunk(message, source=ticket)
+            else:
+                self.logger.error(f'PublishType {message_type} is not supported')
+        finally:
+            # Items handed back to the queue keep their ticket, items in the in-flight window are acked
+            # once ThingsBoard confirms them
+            if not taken_over:
+                self.queue.ack(ticket)
+
+    def _process_telemetry_batch(self, first: Tuple[int, Tuple[PublishType, Dict[str, Any]]]):
+        batch = [first]
+        pending = None
+        deadline = time.monotonic() + self.batch_linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                taken = self.queue.take(timeout=remaining) if remaining > 0 else self.queue.take(block=False)
+            except queue.Empty:
+                break
+            if taken[1][0] != PublishType.TELEMETRY:
+                pending = taken
+                break
+            batch.append(taken)
+        self._publish_batch_items(batch, pending)
+
+    def _publish_batch_items(self, batch: List[Tuple[int, Tuple[PublishType, Dict[str, Any]]]],
+                             pending: Tuple[int, Tuple[PublishType, Dict[str, Any]]] | None):
+        tickets = [ticket for ticket, _ in batch]
+        taken_over: List[int] = []
+        try:
+            taken_over = self.publish_telemetry_batch([item[1] for _, item in batch], tickets)
+        finally:
+            taken_over_tickets = set(taken_over)
+            for ticket in tickets:
+                if ticket not in taken_over_tickets:
+                    self.queue.ack(ticket)
+        if pending is not None:
+            self._process_item(pending)
+
+    async def process_queue_async(self, queue_ready: asyncio.Event):
+        # Event loop counterpart of process_queue, queue_ready is set whenever something is put in the queue
+        loop = asyncio.get_running_loop()
+        connection_changed = asyncio.Event()
+        wake_on_connection = lambda: loop.call_soon_threadsafe(connection_changed.set)
+        self.connection_listeners.append(wake_on_connection)
+        try:
+            await self._drain_queue_async(queue_ready, connection_changed)
+        finally:
+            self.connection_listeners.remove(wake_on_connection)
+
+    async def _drain_queue_async(self, queue_ready: asyncio.Event, connection_changed: asyncio.Event):
+        # Client publishes and queue writes (requeues, acks, journal records) block, so they run in a
+        # worker thread. asyncio.run waits for it before the handler is stopped
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.is_connected():
+                await loop.run_in_executor(None, self._settle_in_flight)
+                await self._wait_for_connection_async(connection_changed)
+                continue
+            if self._publish_failed:
+                self._publish_failed = False
+                await asyncio.sleep(self.reconnect_min_delay)
+                continue
+            if self.window is not None:
+                if await loop.run_in_executor(None, self._settle_in_flight) and self.is_connected():
+                    await asyncio.sleep(self.reconnect_min_delay)
+                    continue
+                if self.window.full():
+                    # PUBACKs arrive on the paho thread, poll for room in the window
+                    await asyncio.sleep(0.01)
+                    continue
+            wait = self.api_limits_manager.time_until_available()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            taken = await self._take_async(queue_ready, self._get_timeout())
+            if taken is None:
+                continue
+            if self.batch_size > 1 and taken[1][0] == PublishType.TELEMETRY:
+                await self._process_telemetry_batch_async(taken, queue_ready)
+            else:
+                await loop.run_in_executor(None, self._process_item, taken)
+
+    async def _take_async(self, queue_ready: asyncio.Event, timeout: float) -> Tuple[int, Tuple[PublishType, Dict[str, Any]]] | None:
+        taken = self._take_nowait()
+        if taken is not None:
+            return taken
+        queue_ready.clear()
+        # Re-check after clearing, a put may have landed in between
+        taken = self._take_nowait()
+        if taken is not None:
+            return taken
+        try:
+            await asyncio.wait_for(queue_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self._take_nowait()
+
+    async def _process_telemetry_batch_async(self, first: Tuple[int, Tuple[PublishType, Dict[str, Any]]], queue_ready: asyncio.Event):
+        loop = asyncio.get_running_loop()
+        batch = [first]
+        pending = None
+        deadline = time.monotonic() + self.batch_linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            taken = await self._take_async(queue_ready, remaining) if remaining > 0 else self._take_nowait()
+            if taken is None:
+                break
+            if taken[1][0] != PublishType.TELEMETRY:
+                pending = taken
+                break
+            batch.append(taken)
+        await loop.run_in_executor(None, self._publish_batch_items, batch, pending)
+
+    def _take_nowait(self) -> Tuple[int, Tuple[PublishType, Dict[str, Any]]] | None:
+        try:
+            return self.queue.take(block=False)
+        except queue.Empty:
+            return None
+
+    async def _wait_for_connection_async(self, connection_changed: asyncio.Event):
+        delay = self._connection_wait()
+        deadline = time.monotonic() + delay
+        while True:
+            # Clear before checking, so a change signalled in between is not lost
+            connection_changed.clear()
+            remaining = deadline - time.monotonic()
+            if self.is_connected() or remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(connection_changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        if self.is_connected():
+            return
+        self._connection_timed_out(delay)
+        if not self._loop_started:
+            await asyncio.get_running_loop().run_in_executor(None, self.connect)
+
+    def start(self, drain_thread: bool = True):
+        self.shutdown_flag.clear()
         self.connect()
-        self.shutdown_flag = threading.Event()
-        time.sleep(2)
-        threading.Thread(target=self.process_queue, daemon=True).start()
+        if drain_thread:
+            self._drain_thread = threading.Thread(target=self.process_queue, name="process_queue", daemon=True)
+            self._drain_thread.start()
         self.logger.info("MQTT Handler started")
 
     def stop(self):
         self.shutdown_flag.set()
+        with self.connection_changed:
+            self.connection_changed.notify_all()
+        if self._drain_thread is not None:
+            # Settling below must not race the drain thread tracking or requeueing publishes of its own
+            self._drain_thread.join(self.idle_timeout + 1)
+            if self._drain_thread.is_alive():
+                self.logger.warning("Queue drain thread did not stop in time")
+            self._drain_thread = None
+        if self.window is not None and len(self.window):
+            # Give the last publishes a moment to be confirmed, the rest goes back to the queue (and its journal)
+            self.window.wait_until_empty(2)
+            self.window.fail_all()
+            self._settle_in_flight()
         if self.client:
             self.client.disconnect()
-        self.logger.info("MQTT Handler stopped")
\ No newline at end of file
+        stats = self.encoder.stats
+        if stats["events"]:
+            self.logger.info(f"Telemetry sent: {stats['events']} panel events, {stats['sent_bytes']} bytes in total "
+                             f"({self.encoder.bytes_per_event():.1f} bytes/event, {stats['raw_bytes']} before compression)")
+        self.logger.info("MQTT Handler stopped")
@@ -1,19 +1,27 @@
-import RPi.GPIO as GPIO
 import threading
+import asyncio
+import time
 from typing import Dict
-from classes.enums import PublishType
 import logging
 from config.schema import ConfigSchema
-from classes.mqtt_sender import MqttHandler
+from classes.mqtt_sender import MqttHandler, TS_KEY
+from components.gpio_backend import GpioBackend
 
 class RelayMonitor:
-    def __init__(self, config: ConfigSchema, mqtt_handler: MqttHandler):
+    def __init__(self, config: ConfigSchema, mqtt_handler: MqttHandler, gpio: GpioBackend):
         self.config = config
         self.mqtt_handler = mqtt_handler
         self.relay_pins = self._get_relay_pins()
         self.active_states = self._get_active_states()
         self.publish_interval = config.relay_monitor.publish_interval
+        self.heartbeat_interval = config.relay_monitor.heartbeat_interval
+        self.debounce = config.relay_monitor.debounce_ms / 1000
+        self.mode = config.relay_monitor.mode
         self.logger = logging.getLogger(__name__)
+        self.gpio = gpio
+        self.edge_detected = threading.Event()
+        self.last_published: Dict[str, bool] | None = None
+        self.last_publish_time = 0.0
         self._setup_gpio()
 
     def _get_relay_pins(self) -> Dict[str, int]:
@@ -24,36 +32,109 @@ class RelayMonitor:
 
     def _get_active_states(self) -> Dict[str, int]:
         return {
-            'ALARM': GPIO.HIGH if self.config.relay_monitor.alarm_active_high else GPIO.LOW,
-            'TROUBLE': GPIO.HIGH if self.config.relay_monitor.trouble_active_high else GPIO.LOW
+            'ALARM': 1 if self.config.relay_monitor.alarm_active_high else 0,
+            'TROUBLE': 1 if self.config.relay_monitor.trouble_active_high else 0
         }
 
     def _setup_gpio(self):
-        GPIO.setmode(GPIO.BCM)
         for pin in self.relay_pins.values():
-            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            self.gpio.setup_input(pin, pull_up=True)
+
+    def _on_edge(self, pin: int):
+        self.edge_detected.set()
+
+    def wakeup(self):
+        self.edge_detected.set()
 
     def monitor_relays(self, shutdown_flag: threading.Event):
+        if self.mode == "edge":
+            self._monitor_edges(shutdown_flag)
+        else:
+            self._poll_relays(shutdown_flag)
+
+    def _poll_relays(self, shutdown_flag: threading.Event):
         while not shutdown_flag.is_set():
-            telemetry = self._get_relay_states()
-            self._publish_telemetry(telemetry)
-            
+            self._publish_if_needed()
             if shutdown_flag.wait(self.publish_interval):
                 break
 
+    def _monitor_edges(self, shutdown_flag: threading.Event):
+        debounce_ms = int(self.debounce * 1000)
+        for pin in self.relay_pins.values():
+            self.gpio.add_edge_callback(pin, self._on_edge, debounce_ms)
+        try:
+            self._publish_if_needed()
+            while not shutdown_flag.is_set():
+                next_heartbeat = self.last_publish_time + self.heartbeat_interval - time.monotonic()
+                if self.edge_detected.wait(max(0, next_heartbeat)):
+                    self.edge_detected.clear()
+                    # Software debounce: let the contact settle before sampling it
+                    if shutdown_flag.wait(self.debounce):
+                        break
+                self._publish_if_needed()
+        finally:
+            for pin in self.relay_pins.values():
+                try:
+                    self.gpio.remove_edge_callback(pin)
+                except Exception as e:
+                    self.logger.error(f"Error removing edge detection on pin {pin}: {e}")
+
+    async def monitor_relays_async(self):
+        if self.mode != "edge":
+            while True:
+                self._publish_if_needed()
+                await asyncio.sleep(self.publish_interval)
+
+        loop = asyncio.get_running_loop()
+        edge_detected = asyncio.Event()
+        # GPIO callbacks fire on the GPIO library thread, hand them over to the event loop
+        on_edge = lambda pin: loop.call_soon_threadsafe(edge_detected.set)
+        debounce_ms = int(self.debounce * 1000)
+        for pin in self.relay_pins.values():
+            self.gpio.add_edge_callback(pin, on_edge, debounce_ms)
+        try:
+            self._publish_if_needed()
+            while True:
+                next_heartbeat = self.last_publish_time + self.heartbeat_interval - time.monotonic()
+                try:
+                    await asyncio.wait_for(edge_detected.wait(), max(0, next_heartbeat))
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    edge_detected.clear()
+                    await asyncio.sleep(self.debounce)
+                self._publish_if_needed()
+        finally:
+            for pin in self.relay_pins.values():
+                try:
+                    self.gpio.remove_edge_callback(pin)
+                except Exception as e:
+                    self.logger.error(f"Error removing edge detection on pin {pin}: {e}")
+
+    def _publish_if_needed(self):
+        telemetry = self._get_relay_states()
+        if telemetry != self.last_published:
+            # Transitions are queued so they survive rate limits and outages
+            self._publish_telemetry(telemetry, bypass_queue=False, delta=self.config.mqtt.delta_state_telemetry)
+        elif time.monotonic() - self.last_publish_time >= self.heartbeat_interval:
+            # The heartbeat always carries the full state
+            self._publish_telemetry(telemetry, bypass_queue=True, delta=False)
+
     def _get_relay_states(self) -> Dict[str, bool]:
         states = {}
         for status, pin in self.relay_pins.items():
-            gpio_state = GPIO.input(pin)
+            gpio_state = self.gpio.read(pin)
             active_state = self.active_states[status]
             is_active = gpio_state == active_state
             states[f"{status.lower()}_relay"] = is_active
         return states
 
-    def _publish_telemetry(self, telemetry: Dict[str, bool]):
+    def _publish_telemetry(self, telemetry: Dict[str, bool], bypass_queue: bool, delta: bool):
+        self.last_published = telemetry
+        self.last_publish_time = time.monotonic()
         try:
-            self.mqtt_handler.publish_telemetry(telemetry, bypass_queue=True)
-            #.logger.debug(f'Relay states published: {telemetry}')
+            # Stamped with the time it was read, so a queued transition is not recorded at delivery time
+            self.mqtt_handler.publish_telemetry({**telemetry, TS_KEY: int(time.time() * 1000)}, bypass_queue=bypass_queue, delta=delta)
         except Exception as e:
             self.logger.error(f'Failed to publish relay states: {e}')
 
@@ -65,4 +146,4 @@ class RelayMonitor:
             self.logger.error(f"Error during GPIO cleanup in RelayMonitor: {e}")
 
     def _cleanup_gpio(self):
-        GPIO.cleanup(list(self.relay_pins.values()))
\ No newline at end of file
+        self.gpio.cleanup(self.relay_pins.values())
@@ -0,0 +1,55 @@
+import base64
+import json
+import time
+import zlib
+from typing import Any, Dict, List
+
+REPORT_ENCODING = "json+zlib+base64"
+
+class ReportChunker:
+    # Collects parsed report rows and turns every chunk_rows of them into one compressed telemetry message,
+    # so only a single chunk of a report is ever held in memory
+    def __init__(self, chunk_rows: int = 200, compression_level: int = 6):
+        self.chunk_rows = max(1, chunk_rows)
+        self.compression_level = compression_level
+        self.report_id: int | None = None
+        self.rows: List[Dict[str, Any]] = []
+        self.chunk_index = 0
+        self.total_rows = 0
+
+    def add_row(self, row: Dict[str, Any]) -> Dict[str, Any] | None:
+        if self.report_id is None:
+            self.report_id = int(time.time() * 1000)
+            self.chunk_index = 0
+            self.total_rows = 0
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_rows:
+            return self._build_chunk(last=False)
+        return None
+
+    def finish(self) -> Dict[str, Any] | None:
+        if self.report_id is None:
+            return None
+        chunk = self._build_chunk(last=True)
+        self.report_id = None
+        return chunk
+
+    def _build_chunk(self, last: bool) -> Dict[str, Any]:
+        data = json.dumps(self.rows, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        self.total_rows += len(self.rows)
+        chunk = {
+            "report_id": self.report_id,
+            "report_chunk": self.chunk_index,
+            "report_last": last,
+            "report_rows": len(self.rows),
+            "report_encoding": REPORT_ENCODING,
+            "report_data": base64.b64encode(zlib.compress(data, self.compression_level)).decode("ascii")
+        }
+        if last:
+            chunk["report_total_rows"] = self.total_rows
+        self.chunk_index += 1
+        self.rows = []
+        return chunk
+
+def decode_report_chunk(chunk: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return json.loads(zlib.decompress(base64.b64decode(chunk["report_data"])))
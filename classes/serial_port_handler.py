@@ -1,22 +1,50 @@
 import serial
-from app_utils.queue_operations import SafeQueue
-from typing import Tuple, Dict, Any
-from classes.enums import PublishType
+from app_utils.queue_operations import SafeQueue, DEVICE_KEY
+from typing import Callable, Dict, Any, List
+from classes.enums import PublishType, FrameKind
+from classes.framing import Framer, FramingRules, Frame
+from classes.severity_rules import SeverityClassifier
+from classes.event_coalescer import EventCoalescer
+from classes.event_record import EventRecord
+from classes.report_stream import ReportChunker
+from app_utils.metrics import REGISTRY
+from app_utils.serial_capture import CaptureWriter
+import os
 import time
+import asyncio
 import logging
+import select
+import selectors
 import threading
 from config.schema import ConfigSchema
 
+SERIAL_BYTES = REGISTRY.counter("facp_serial_bytes_total", "Bytes read from the panel serial port", ["panel"])
+EVENTS_PARSED = REGISTRY.counter("facp_events_parsed_total", "Panel events parsed", ["panel"])
+PARSE_FAILURES = REGISTRY.counter("facp_parse_failures_total", "Panel frames that could not be parsed", ["panel"])
+PARSE_SECONDS = REGISTRY.histogram("facp_parse_seconds", "Time spent parsing one panel event", ["panel"])
+SERIAL_DISCONNECTS = REGISTRY.counter("facp_serial_disconnects_total", "Serial connections lost", ["panel"])
+
 class SerialPortHandler:
-    def __init__(self, config: ConfigSchema, eventSeverityLevels: Dict[str, int], queue: SafeQueue):
+    # Used when eventSeverityLevels.yml has no rules section for the panel
+    default_severity_rules: Dict[str, Any] = {}
+
+    def __init__(self, config: ConfigSchema, eventSeverityLevels: Dict[str, int], queue: SafeQueue,
+                 severity_rules: Dict[str, Any] | None = None):
         self.config = config
         self.queue = queue
         self.eventSeverityLevels = eventSeverityLevels
         self.ser: serial.Serial | None = None
         self.logger = logging.getLogger(__name__)
-        self.report_delimiter = ""
-        self.max_report_delimiter_count = -1
+        self.framing_rules = FramingRules()
         self.default_event_severity_not_recognized = 0
+        self.severity_classifier = SeverityClassifier(
+            eventSeverityLevels,
+            severity_rules if severity_rules is not None else self.default_severity_rules,
+            default=self.default_event_severity_not_recognized
+        )
+        self.coalescer = EventCoalescer(config.coalescing.window, config.coalescing.max_keys)
+        self.report_chunker = ReportChunker(config.report.chunk_rows, config.report.compression_level)
+        self.device_name: str | None = None
         self.parity_dic = {'none': serial.PARITY_NONE, 
             'even': serial.PARITY_EVEN,
             'odd': serial.PARITY_ODD
@@ -25,6 +53,22 @@ class SerialPortHandler:
         self.max_reconnect_delay = 60
         self.base_delay = 1
         self.serial_config = {}
+        self.reader_mode = config.serial.reader_mode
+        panel = config.serial.puerto
+        self.serial_bytes = SERIAL_BYTES.labels(panel)
+        self.events_parsed = EVENTS_PARSED.labels(panel)
+        self.parse_failures = PARSE_FAILURES.labels(panel)
+        self.parse_seconds = PARSE_SECONDS.labels(panel)
+        self.serial_disconnects = SERIAL_DISCONNECTS.labels(panel)
+        self.capture: CaptureWriter | None = None
+        if config.serial.capture_path:
+            self.capture = CaptureWriter(config.serial.capture_path, config.serial.capture_max_bytes, config.serial.capture_backup_count)
+        self.poll_interval = 0.1
+        self.idle_timeout = 1
+        self.selector: selectors.BaseSelector | None = None
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
 
     def init_serial_port(self) -> None:
         self.ser = serial.Serial(
@@ -37,30 +81,135 @@ class SerialPortHandler:
             timeout=self.serial_config.get('timeout')
         )
 
-    def open_serial_port(self) -> None:
+    def open_serial_port(self, register_selector: bool = True) -> None:
         try:
             if self.ser is None:
                 self.init_serial_port()
             if not self.ser.is_open:
                 self.ser.open()
                 self.queue.is_serial_connected = True
+            if register_selector:
+                self._register_selector()
             self.logger.debug("Serial connected")
                 
         except serial.SerialException as e:
             raise serial.SerialException(f"An error occurred while opening the specified port: {e}")
         
-    def publish_parsed_report(self, buffer: str) -> None:
-        self.logger.warning("Publish reports is currently not supported. Dismissing report.")
+    def _register_selector(self) -> None:
+        if self.reader_mode != "select" or self.selector is not None:
+            return
+        try:
+            fileno = self.ser.fileno()
+        except (AttributeError, NotImplementedError, serial.SerialException) as e:
+            self.logger.warning(f"Serial port has no file descriptor ({e}). Falling back to polling reads.")
+            return
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(fileno, selectors.EVENT_READ, "serial")
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, "wakeup")
+
+    def _close_selector(self) -> None:
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
+
+    def _serial_reader(self) -> Callable[[memoryview], int]:
+        # pyserial's readinto reads into a new bytes object and copies it, so ports with a descriptor
+        # are read with os.readv straight into the framer buffer
+        ser = self.ser
+        if hasattr(os, "readv"):
+            try:
+                fileno = ser.fileno()
+            except (AttributeError, NotImplementedError, serial.SerialException):
+                pass
+            else:
+                return lambda view: os.readv(fileno, [view])
+
+        def read_copy(view: memoryview) -> int:
+            data = ser.read(len(view))
+            view[:len(data)] = data
+            return len(data)
+        return read_copy
+
+    def wakeup(self) -> None:
+        if self._wakeup_w is None:
+            return
+        try:
+            os.write(self._wakeup_w, b"\0")
+        except BlockingIOError:
+            pass
+
+    def close_wakeup_pipe(self) -> None:
+        # Only for handlers that are thrown away (replay, benchmarks), the reader must have stopped
+        self._close_selector()
+        for fd in (self._wakeup_r, self._wakeup_w):
+            if fd is not None:
+                os.close(fd)
+        self._wakeup_r = self._wakeup_w = None
+
+    def wait_for_data(self, shutdown_flag: threading.Event) -> bool:
+        if self.ser.in_waiting > 0:
+            return True
+        if self.selector is None:
+            shutdown_flag.wait(self.poll_interval)
+            return False
+
+        serial_ready = False
+        for key, _ in self.selector.select(timeout=self.idle_timeout):
+            if key.data == "wakeup":
+                self._drain_wakeup_pipe()
+            else:
+                serial_ready = True
+        if serial_ready and self.ser.in_waiting == 0:
+            # A readable descriptor with nothing to read means the device went away
+            raise serial.SerialException("Serial device reported readable without data")
+        return serial_ready
+
+    def _drain_wakeup_pipe(self) -> None:
+        try:
+            while os.read(self._wakeup_r, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def publish_report_row(self, row: str) -> None:
+        chunk = self.report_chunker.add_row(self.parse_report_row(row))
+        if chunk is not None:
+            self.queue_report_chunk(chunk)
+
+    def finish_report(self) -> None:
+        chunk = self.report_chunker.finish()
+        if chunk is not None:
+            self.queue_report_chunk(chunk)
+            self.logger.info(f"Report {chunk['report_id']} queued: {chunk['report_total_rows']} rows in {chunk['report_chunk'] + 1} chunks")
+
+    def queue_report_chunk(self, chunk: Dict[str, Any]) -> None:
+        if self.device_name:
+            chunk[DEVICE_KEY] = self.device_name
+        self.queue.put((PublishType.REPORT, chunk))
+
+    def parse_report_row(self, row: str) -> Dict[str, Any]:
+        return {"line": row}
 
     def publish_parsed_event(self, buffer: str) -> None:
+        start = time.perf_counter()
         parsed_data = self.parse_string_event(buffer)
+        self.parse_seconds.observe(time.perf_counter() - start)
         if parsed_data is not None:
-            self.logger.info(f'Event queued: {parsed_data}')
-            self.queue.put((PublishType.TELEMETRY, parsed_data))
+            self.events_parsed.inc()
+            self.queue_events(self.coalescer.offer(parsed_data))
         else:
+            self.parse_failures.inc()
             self.logger.debug("The parsed event information is empty, skipping MQTT publish.")
 
-    def parse_string_event(self, event: str) -> Dict[str, Any] | None:
+    def queue_events(self, events: List[EventRecord]) -> None:
+        for event in events:
+            if self.device_name:
+                event[DEVICE_KEY] = self.device_name
+            # Arguments are only formatted if the record is emitted
+            self.logger.info('Event queued: %s', event)
+            self.queue.put((PublishType.TELEMETRY, event))
+
+    def parse_string_event(self, event: str) -> EventRecord | None:
         self.logger.error("The 'parse_string_event' function must be implemented in the specific handler!")
         return None
 
@@ -82,6 +231,7 @@ class SerialPortHandler:
                     break
 
     def close_serial_port(self) -> None:
+        self._close_selector()
         if self.ser:
             try:
                 if self.ser.is_open:
@@ -93,55 +243,130 @@ class SerialPortHandler:
         self.queue.is_serial_connected = False
 
     def process_incoming_data(self, shutdown_flag: threading.Event) -> None:
-        buffer = ""
-        report_count = 0
-
         if self.ser is None:
             raise ValueError("Serial port is not initialized")
 
+        # A report cut short by a previous reader failure cannot continue in a new framer
+        self.finish_report()
+        framer = Framer(self.framing_rules)
+        read_into = self._serial_reader()
         try:
             while not shutdown_flag.is_set():
-                if self.ser.in_waiting > 0:
-                    raw_data = self.ser.readline()
-                    incoming_line = raw_data.decode('latin-1').strip()
-                    if not incoming_line:
-                        if_eof = self.handle_empty_line(buffer, report_count)
-                        if if_eof:
-                            buffer = ""
-                            report_count = 0
-                    else:
-                        buffer, report_count = self.handle_data_line(incoming_line, buffer, report_count)
+                if self.wait_for_data(shutdown_flag):
+                    data = framer.read_from(read_into, self.ser.in_waiting or 1)
+                    self.record_read(data)
+                    frames = framer.take_frames()
                 else:
-                    time.sleep(0.1)
+                    frames = framer.poll_idle()
+                    self.flush_capture()
+                self.dispatch_frames(frames)
+                self.queue_events(self.coalescer.expire())
         except (serial.SerialException, serial.SerialTimeoutException, OSError) as e:
             raise serial.SerialException(str(e))
         except (TypeError, UnicodeDecodeError) as e:
-            if buffer:
-                if report_count > 0:
-                    self.publish_parsed_report(buffer)
-                else:
-                    self.publish_parsed_event(buffer)
+            self.dispatch_frames(framer.flush())
             raise TypeError(str(e))
         except Exception as e:
             raise Exception(f"Unexpected failure occurred: {str(e)}")
 
-    def handle_data_line(self, incoming_line: str, buffer: str, report_count: int) -> Tuple[str, int]:
-        if self.report_delimiter in incoming_line:
-            report_count += 1
-        buffer += incoming_line + "\n"
-        return buffer, report_count
+    async def listening_to_serial_async(self) -> None:
+        delay = self.base_delay
+        try:
+            while True:
+                try:
+                    # The event loop watches the port descriptor, the reader selector is not used
+                    self.open_serial_port(register_selector=False)
+                except serial.SerialException as e:
+                    self.queue.is_serial_connected = False
+                    self.logger.error(f"Error found trying to open serial: {e}. Retrying in {delay} seconds.")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_reconnect_delay)
+                    continue
+                delay = self.base_delay
+                try:
+                    await self.process_incoming_data_async()
+                except (serial.SerialException, OSError) as e:
+                    self.serial_disconnects.inc()
+                    self.logger.error(f"Lost serial connection. Error: {e}")
+                    self.close_serial_port()
+                except (TypeError, UnicodeDecodeError) as e:
+                    self.logger.error(f"Error occurred, strange character found. Resetting the serial: {e}")
+                    if self.ser:
+                        self.ser.reset_input_buffer()
+        finally:
+            self.queue_events(self.coalescer.flush())
+            self.finish_report()
+            self.close_serial_port()
+            if self.capture is not None:
+                self.capture.close()
 
-    def handle_empty_line(self, buffer: str, report_count: int) -> bool:
-        if report_count == self.max_report_delimiter_count and buffer.strip():
-            self.publish_parsed_report(buffer)
-            return True
-        elif report_count == 0 and buffer.strip():
-            self.publish_parsed_event(buffer)
-            return True
-        else:
-            return False
+    async def process_incoming_data_async(self) -> None:
+        if self.ser is None:
+            raise ValueError("Serial port is not initialized")
+
+        loop = asyncio.get_running_loop()
+        data_ready = asyncio.Event()
+        fileno = self.ser.fileno()
+        self.finish_report()
+        framer = Framer(self.framing_rules)
+        read_into = self._serial_reader()
+        loop.add_reader(fileno, data_ready.set)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(data_ready.wait(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    frames = framer.poll_idle()
+                    self.flush_capture()
+                else:
+                    data_ready.clear()
+                    waiting = self.ser.in_waiting
+                    if waiting == 0:
+                        # The reader callback may fire once more after the data was consumed
+                        if select.select([fileno], [], [], 0)[0]:
+                            raise serial.SerialException("Serial device reported readable without data")
+                        continue
+                    data = framer.read_from(read_into, waiting)
+                    self.record_read(data)
+                    frames = framer.take_frames()
+                self.dispatch_frames(frames)
+                self.queue_events(self.coalescer.expire())
+        except (TypeError, UnicodeDecodeError):
+            self.dispatch_frames(framer.flush())
+            raise
+        finally:
+            loop.remove_reader(fileno)
+
+    def record_read(self, data: bytes | memoryview) -> None:
+        self.serial_bytes.inc(len(data))
+        if self.capture is not None:
+            try:
+                self.capture.write(data)
+            except OSError as e:
+                # A full or failing disk must not stop the panel from being read
+                self.logger.error(f"Serial capture disabled after a write error: {e}")
+                self.capture.close()
+                self.capture = None
+
+    def flush_capture(self) -> None:
+        if self.capture is not None:
+            try:
+                self.capture.flush()
+            except OSError as e:
+                self.logger.error(f"Serial capture disabled after a write error: {e}")
+                self.capture.close()
+                self.capture = None
+
+    def dispatch_frames(self, frames: List[Frame]) -> None:
+        for kind, text in frames:
+            if kind == FrameKind.REPORT_ROW:
+                self.publish_report_row(text)
+            elif kind == FrameKind.REPORT_END:
+                self.finish_report()
+            else:
+                self.publish_parsed_event(text)
 
-    def parse_string_event(self, event: str) -> Dict | None:
+    def parse_string_event(self, event: str) -> EventRecord | None:
         self.logger.error("The 'parse_string_event' function must be implemented!")
         return None
 
@@ -153,6 +378,7 @@ class SerialPortHandler:
                 self.open_serial_port()
                 self.process_incoming_data(shutdown_flag)
             except (serial.SerialException, serial.SerialTimeoutException) as e:
+                self.serial_disconnects.inc()
                 self.logger.error(f"Lost serial connection. Retrying in 5 seconds. Error: {e} ")
                 self.close_serial_port()
                 self.attempt_reconnection(shutdown_flag)
@@ -168,4 +394,8 @@ class SerialPortHandler:
                     break
             else:
                 delay = 1 
-        self.close_serial_port()
\ No newline at end of file
+        self.queue_events(self.coalescer.flush())
+        self.finish_report()
+        self.close_serial_port()
+        if self.capture is not None:
+            self.capture.close()
\ No newline at end of file
@@ -0,0 +1,54 @@
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Pattern, Tuple
+
+_TERMINAL = object()
+
+class PrefixTrie:
+    def __init__(self, prefixes: Dict[str, int]):
+        self.root: Dict[Any, Any] = {}
+        for prefix, value in prefixes.items():
+            node = self.root
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[_TERMINAL] = value
+
+    def longest_match(self, text: str) -> int | None:
+        node = self.root
+        match = node.get(_TERMINAL)
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(_TERMINAL, match)
+        return match
+
+class SeverityClassifier:
+    # Rules are checked in this order: contains, regex, exact event ID, longest prefix, default
+    def __init__(self, exact: Dict[str, int], rules: Dict[str, Any] | None = None, default: int = 0, cache_size: int = 1024):
+        rules = rules or {}
+        self.ignore_case = bool(rules.get('ignore_case', False))
+        self.default = default
+        self.exact = {self._normalize(str(event)): severity for event, severity in (exact or {}).items()}
+        self.contains: List[Tuple[str, int]] = [(self._normalize(str(text)), severity) for text, severity in (rules.get('contains') or {}).items()]
+        flags = re.IGNORECASE if self.ignore_case else 0
+        self.regex: List[Tuple[Pattern[str], int]] = [(re.compile(pattern, flags), severity) for pattern, severity in (rules.get('regex') or {}).items()]
+        self.prefixes = PrefixTrie({self._normalize(str(prefix)): severity for prefix, severity in (rules.get('prefix') or {}).items()})
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    def _normalize(self, text: str) -> str:
+        return text.lower() if self.ignore_case else text
+
+    def _classify(self, event_id: str) -> int:
+        key = self._normalize(event_id)
+        for text, severity in self.contains:
+            if text in key:
+                return severity
+        for pattern, severity in self.regex:
+            if pattern.search(event_id):
+                return severity
+        severity = self.exact.get(key)
+        if severity is not None:
+            return severity
+        severity = self.prefixes.longest_match(key)
+        return self.default if severity is None else severity
@@ -0,0 +1,73 @@
+import base64
+import json
+import time
+import zlib
+from typing import Any, Dict
+
+BATCH_ENCODING = "json+zlib+base64"
+_MISSING = object()
+
+class TelemetryEncoder:
+    # Shrinks what goes over the uplink: state telemetry is reduced to the keys that changed since the
+    # last values ThingsBoard accepted, and payloads over compress_min_bytes are deflated into one value
+    def __init__(self, compress_min_bytes: int = 0, compression_level: int = 6):
+        self.compress_min_bytes = compress_min_bytes
+        self.compression_level = compression_level
+        self.acked: Dict[str | None, Dict[str, Any]] = {}
+        # sent_bytes covers all telemetry, events and event_bytes only payloads carrying panel events, so
+        # relay heartbeats and metrics snapshots do not skew the bytes per event
+        self.stats: Dict[str, int] = {"events": 0, "event_bytes": 0, "raw_bytes": 0, "sent_bytes": 0, "compressed": 0}
+
+    def delta(self, device: str | None, values: Dict[str, Any]) -> Dict[str, Any]:
+        acked = self.acked.get(device)
+        if acked is None:
+            return values
+        return {key: value for key, value in values.items() if acked.get(key, _MISSING) != value}
+
+    def acknowledge(self, device: str | None, values: Dict[str, Any]) -> None:
+        self.acked.setdefault(device, {}).update(values)
+
+    def invalidate(self, device: str | None) -> None:
+        # The values went to the queue instead, the next delta has to start from the full state again
+        self.acked.pop(device, None)
+
+    def encode(self, payload: Any, events: int = 1, panel_events: int = 0) -> Any:
+        data = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        self.stats["raw_bytes"] += len(data)
+        if not self.compress_min_bytes or len(data) < self.compress_min_bytes:
+            self._count_sent(len(data), panel_events)
+            return payload
+
+        encoded = {
+            "ts": self._payload_timestamp(payload),
+            "values": {
+                "batch_encoding": BATCH_ENCODING,
+                "batch_count": events,
+                "batch_data": base64.b64encode(zlib.compress(data, self.compression_level)).decode("ascii")
+            }
+        }
+        encoded_size = len(json.dumps(encoded, separators=(",", ":")))
+        if encoded_size >= len(data):
+            self._count_sent(len(data), panel_events)
+            return payload
+        self._count_sent(encoded_size, panel_events)
+        self.stats["compressed"] += 1
+        return encoded
+
+    def _count_sent(self, size: int, panel_events: int) -> None:
+        self.stats["sent_bytes"] += size
+        if panel_events:
+            self.stats["events"] += panel_events
+            self.stats["event_bytes"] += size
+
+    def bytes_per_event(self) -> float:
+        return self.stats["event_bytes"] / self.stats["events"] if self.stats["events"] else 0.0
+
+    def _payload_timestamp(self, payload: Any) -> int:
+        last = payload[-1] if isinstance(payload, list) and payload else payload
+        if isinstance(last, dict) and "ts" in last:
+            return last["ts"]
+        return int(time.time() * 1000)
+
+def decode_batch(values: Dict[str, Any]) -> Any:
+    return json.loads(zlib.decompress(base64.b64decode(values["batch_data"])))
@@ -0,0 +1,224 @@
+import os
+import threading
+import logging
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, Tuple
+from config.schema import GpioConfig
+
+logger = logging.getLogger(__name__)
+
+EdgeCallback = Callable[[int], None]
+
+class GpioBackend(ABC):
+    @abstractmethod
+    def setup_input(self, pin: int, pull_up: bool = True) -> None:
+        ...
+
+    @abstractmethod
+    def setup_output(self, pin: int) -> None:
+        ...
+
+    @abstractmethod
+    def read(self, pin: int) -> int:
+        ...
+
+    @abstractmethod
+    def write(self, pin: int, level: int) -> None:
+        ...
+
+    @abstractmethod
+    def add_edge_callback(self, pin: int, callback: EdgeCallback, bouncetime_ms: int) -> None:
+        ...
+
+    @abstractmethod
+    def remove_edge_callback(self, pin: int) -> None:
+        ...
+
+    @abstractmethod
+    def cleanup(self, pins: Iterable[int]) -> None:
+        ...
+
+class RPiGpioBackend(GpioBackend):
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        GPIO.setmode(GPIO.BCM)
+
+    def setup_input(self, pin: int, pull_up: bool = True) -> None:
+        self.GPIO.setup(pin, self.GPIO.IN, pull_up_down=self.GPIO.PUD_UP if pull_up else self.GPIO.PUD_DOWN)
+
+    def setup_output(self, pin: int) -> None:
+        self.GPIO.setup(pin, self.GPIO.OUT)
+
+    def read(self, pin: int) -> int:
+        return self.GPIO.input(pin)
+
+    def write(self, pin: int, level: int) -> None:
+        self.GPIO.output(pin, self.GPIO.HIGH if level else self.GPIO.LOW)
+
+    def add_edge_callback(self, pin: int, callback: EdgeCallback, bouncetime_ms: int) -> None:
+        self.GPIO.add_event_detect(pin, self.GPIO.BOTH, callback=callback, bouncetime=max(1, bouncetime_ms))
+
+    def remove_edge_callback(self, pin: int) -> None:
+        self.GPIO.remove_event_detect(pin)
+
+    def cleanup(self, pins: Iterable[int]) -> None:
+        self.GPIO.cleanup(list(pins))
+
+class GpiodBackend(GpioBackend):
+    def __init__(self, chip: str, consumer: str = "facp-gateway"):
+        import gpiod
+        from gpiod.line import Bias, Direction, Edge, Value
+        self.gpiod = gpiod
+        self.Bias, self.Direction, self.Edge, self.Value = Bias, Direction, Edge, Value
+        self.chip = chip
+        self.consumer = consumer
+        self.requests: Dict[int, Any] = {}
+        self.settings: Dict[int, Any] = {}
+        self.watchers: Dict[int, Tuple[threading.Event, threading.Thread]] = {}
+
+    def _request(self, pin: int, settings: Any) -> None:
+        self.settings[pin] = settings
+        request = self.requests.get(pin)
+        if request is None:
+            self.requests[pin] = self.gpiod.request_lines(self.chip, consumer=self.consumer, config={pin: settings})
+        else:
+            request.reconfigure_lines(config={pin: settings})
+
+    def setup_input(self, pin: int, pull_up: bool = True) -> None:
+        self._request(pin, self.gpiod.LineSettings(
+            direction=self.Direction.INPUT,
+            bias=self.Bias.PULL_UP if pull_up else self.Bias.PULL_DOWN
+        ))
+
+    def setup_output(self, pin: int) -> None:
+        self._request(pin, self.gpiod.LineSettings(direction=self.Direction.OUTPUT, output_value=self.Value.INACTIVE))
+
+    def read(self, pin: int) -> int:
+        return 1 if self.requests[pin].get_value(pin) == self.Value.ACTIVE else 0
+
+    def write(self, pin: int, level: int) -> None:
+        self.requests[pin].set_value(pin, self.Value.ACTIVE if level else self.Value.INACTIVE)
+
+    def add_edge_callback(self, pin: int, callback: EdgeCallback, bouncetime_ms: int) -> None:
+        settings = self.settings[pin]
+        settings.edge_detection = self.Edge.BOTH
+        settings.debounce_period = timedelta(milliseconds=bouncetime_ms)
+        self._request(pin, settings)
+        stop = threading.Event()
+        watcher = threading.Thread(target=self._watch_edges, args=(pin, callback, stop), name=f"gpiod-edges-{pin}", daemon=True)
+        self.watchers[pin] = (stop, watcher)
+        watcher.start()
+
+    def _watch_edges(self, pin: int, callback: EdgeCallback, stop: threading.Event) -> None:
+        request = self.requests[pin]
+        while not stop.is_set():
+            try:
+                if not request.wait_edge_events(timedelta(milliseconds=500)):
+                    continue
+                request.read_edge_events()
+            except Exception as e:
+                if not stop.is_set():
+                    logger.error(f"Error waiting for edge events on GPIO line {pin}: {e}")
+                return
+            callback(pin)
+
+    def _stop_watcher(self, pin: int) -> None:
+        # The watcher must be done with the request before it is reconfigured or released
+        stop, watcher = self.watchers.pop(pin, (None, None))
+        if stop is None:
+            return
+        stop.set()
+        if watcher is not threading.current_thread():
+            watcher.join(timeout=2)
+            if watcher.is_alive():
+                logger.warning(f"Edge watcher of GPIO line {pin} did not stop in time")
+
+    def remove_edge_callback(self, pin: int) -> None:
+        self._stop_watcher(pin)
+        settings = self.settings.get(pin)
+        if settings is not None:
+            settings.edge_detection = self.Edge.NONE
+            self._request(pin, settings)
+
+    def cleanup(self, pins: Iterable[int]) -> None:
+        for pin in pins:
+            self._stop_watcher(pin)
+            self.settings.pop(pin, None)
+            request = self.requests.pop(pin, None)
+            if request is not None:
+                request.release()
+
+class SimulatedGpioBackend(GpioBackend):
+    def __init__(self):
+        self.levels: Dict[int, int] = {}
+        self.callbacks: Dict[int, EdgeCallback] = {}
+        self.lock = threading.Lock()
+
+    def setup_input(self, pin: int, pull_up: bool = True) -> None:
+        with self.lock:
+            self.levels.setdefault(pin, 1 if pull_up else 0)
+
+    def setup_output(self, pin: int) -> None:
+        with self.lock:
+            self.levels.setdefault(pin, 0)
+
+    def read(self, pin: int) -> int:
+        with self.lock:
+            return self.levels.get(pin, 0)
+
+    def write(self, pin: int, level: int) -> None:
+        self.set_level(pin, level)
+
+    def set_level(self, pin: int, level: int) -> None:
+        with self.lock:
+            changed = self.levels.get(pin) != level
+            self.levels[pin] = 1 if level else 0
+            callback = self.callbacks.get(pin)
+        if changed and callback is not None:
+            callback(pin)
+
+    def add_edge_callback(self, pin: int, callback: EdgeCallback, bouncetime_ms: int) -> None:
+        with self.lock:
+            self.callbacks[pin] = callback
+
+    def remove_edge_callback(self, pin: int) -> None:
+        with self.lock:
+            self.callbacks.pop(pin, None)
+
+    def cleanup(self, pins: Iterable[int]) -> None:
+        with self.lock:
+            for pin in pins:
+                self.callbacks.pop(pin, None)
+                self.levels.pop(pin, None)
+
+def create_gpio_backend(config: GpioConfig) -> GpioBackend:
+    backend = config.backend
+    if backend == "auto":
+        # Relay states read from a pin nobody drives would be reported as real alarms, so the
+        # simulated backend is never picked implicitly
+        errors = []
+        try:
+            return RPiGpioBackend()
+        except (ImportError, RuntimeError) as e:
+            errors.append(f"RPi.GPIO: {e}")
+        try:
+            return _open_gpiod(config.chip)
+        except (ImportError, OSError) as e:
+            errors.append(f"gpiod: {e}")
+        raise RuntimeError(f"No GPIO backend available ({'; '.join(errors)}). "
+                           "Set gpio.backend to simulated to run without relay hardware")
+
+    if backend == "rpi":
+        return RPiGpioBackend()
+    if backend == "gpiod":
+        return _open_gpiod(config.chip)
+    logger.warning("Using the simulated GPIO backend, relay states are not read from hardware")
+    return SimulatedGpioBackend()
+
+def _open_gpiod(chip: str) -> GpiodBackend:
+    # Lines are only requested on setup, a missing chip would otherwise go unnoticed until then
+    if not os.path.exists(chip):
+        raise FileNotFoundError(f"GPIO chip {chip} not found")
+    return GpiodBackend(chip)
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app_utils.metrics import MetricsRegistry
+from classes.mqtt_sender import MqttHandler
+from config.schema import MetricsConfig
+from logging_setup import recent_log_lines
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class MetricsServer:
+    def __init__(self, config: MetricsConfig, registry: MetricsRegistry, mqtt_handler: MqttHandler):
+        self.config = config
+        self.registry = registry
+        self.mqtt_handler = mqtt_handler
+        self.httpd: ThreadingHTTPServer | None = None
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        if not self.config.http_enabled:
+            return
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    body, content_type = registry.render().encode("utf-8"), PROMETHEUS_CONTENT_TYPE
+                elif path == "/logs":
+                    # Last records kept in memory by the queued logging pipeline
+                    body, content_type = "\n".join(recent_log_lines()).encode("utf-8"), "text/plain; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.httpd = ThreadingHTTPServer((self.config.host, self.config.port), Handler)
+        except OSError as e:
+            self.logger.error(f"Could not start the metrics endpoint on {self.config.host}:{self.config.port}: {e}")
+            return
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, name="metrics_http", daemon=True).start()
+        self.logger.info(f"Metrics endpoint listening on http://{self.config.host}:{self.config.port}/metrics")
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def publish_metrics(self, shutdown_flag: threading.Event):
+        while not shutdown_flag.wait(self.config.telemetry_interval):
+            self._publish()
+
+    async def publish_metrics_async(self):
+        while True:
+            await asyncio.sleep(self.config.telemetry_interval)
+            self._publish()
+
+    def _publish(self):
+        try:
+            # Metrics are a snapshot, an outdated one is not worth queueing. Only the values that changed since
+            # the last snapshot ThingsBoard accepted are sent, most counters stay flat between intervals
+            self.mqtt_handler.publish_telemetry(self.registry.snapshot(), bypass_queue=True, delta=True)
+        except Exception as e:
+            self.logger.error(f"Failed to publish metrics: {e}")
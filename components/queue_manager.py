@@ -1,45 +1,99 @@
+import os
+import asyncio
+import time
 import threading
 import logging
-from app_utils.file_operations import save_to_file, load_from_file
+from app_utils.file_operations import iter_file, save_to_file
+from app_utils.journal import QueueJournal
 from app_utils.queue_operations import SafeQueue
 import pickle
 
 class QueueManager:
-    def __init__(self, queue: SafeQueue, queue_file_path: str):
+    def __init__(self, queue: SafeQueue, journal_dir: str, backup_path: str | None = None,
+                 sync_interval: float = 1, compact_interval: float = 60):
         self.queue = queue
-        self.queue_file_path = queue_file_path
+        self.journal = QueueJournal(journal_dir)
+        self.backup_path = backup_path
+        self.sync_interval = sync_interval
+        self.compact_interval = compact_interval
+        self.last_compaction = time.monotonic()
         self.logger = logging.getLogger(__name__)
 
-    def save_queue_periodically(self, shutdown_flag: threading.Event):
+    def sync_journal_periodically(self, shutdown_flag: threading.Event):
         while not shutdown_flag.is_set():
-            self.save_queue()
-            if shutdown_flag.wait(30):
-                break
+            self.journal.wait_for_pending(self.sync_interval)
+            self.maintain_journal()
 
-    def save_queue(self):
+    async def sync_journal_async(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            # fsync and compaction block on the SD card, keep them off the event loop
+            await loop.run_in_executor(None, self.maintain_journal)
+
+    def maintain_journal(self):
+        try:
+            self.journal.sync()
+            if time.monotonic() - self.last_compaction >= self.compact_interval:
+                self.last_compaction = time.monotonic()
+                self.journal.compact()
+        except Exception as e:
+            self.logger.error(f"Error maintaining queue journal: {e}")
+
+    def close(self):
+        if self.queue.journal is None:
+            self._save_backup()
+        else:
+            try:
+                self.journal.close()
+            except Exception as e:
+                self.logger.error(f"Error closing queue journal: {e}")
+        try:
+            self.queue.close()
+        except OSError as e:
+            self.logger.error(f"Error removing the queue spill file: {e}")
+
+    def _save_backup(self) -> None:
+        # Without a usable journal the pending items are written once at shutdown and migrated back on the next start
+        if not self.backup_path:
+            return
         try:
-            with self.queue.mutex:
-                queue_contents = list(self.queue.queue)
-            save_to_file(queue_contents, self.queue_file_path)
-            #self.logger.debug(f"Queue saved to {self.queue_file_path}")
+            count = save_to_file(self.queue.snapshot(), self.backup_path)
+            if count:
+                self.logger.info(f"Journal unavailable, {count} pending items saved to {self.backup_path}")
+            else:
+                os.remove(self.backup_path)
         except Exception as e:
-            self.logger.error(f"Error saving queue: {e}")
+            self.logger.error(f"Error saving queue backup: {e}")
 
     def load_queue(self) -> None:
         try:
-            items = load_from_file(self.queue_file_path)
-            if not isinstance(items, list):
-                raise TypeError("Loaded data is not a list")
-            
-            for item in items:
+            pending = self.journal.open()
+            restored = self.queue.restore(self.journal.replay())
+            self.queue.attach_journal(self.journal)
+            self.logger.info(f"Queue replayed from {self.journal.directory}, {restored} of {pending} pending items restored")
+        except Exception as e:
+            self.logger.error(f"Unexpected error replaying queue journal, continuing without persistence: {e}")
+        self._migrate_backup()
+
+    def _migrate_backup(self) -> None:
+        if not self.backup_path or not os.path.exists(self.backup_path):
+            return
+        try:
+            # Records are streamed straight into the journaled queue, the backup is never held as one list
+            count = 0
+            for item in iter_file(self.backup_path):
                 self.queue.put(item)
-            
-            self.logger.info(f"Queue loaded from {self.queue_file_path}, {len(items)} items added")
-        except FileNotFoundError:
-            self.logger.warning(f"File {self.queue_file_path} not found. Starting with an empty queue.")
+                count += 1
+            if self.queue.journal is not None:
+                self.journal.sync()
+                os.remove(self.backup_path)
+
+            self.logger.info(f"Queue migrated from {self.backup_path}, {count} items added")
         except EOFError:
-            self.logger.debug("Queue file is empty. Starting with an empty queue.")
-        except (pickle.UnpicklingError, AttributeError, TypeError) as e:
-            self.logger.error(f"Error unpickling queue data: {e}")
+            self.logger.debug("Queue backup file is empty. Removing it.")
+            os.remove(self.backup_path)
+        except (pickle.UnpicklingError, AttributeError, TypeError, ValueError) as e:
+            self.logger.error(f"Error reading queue backup: {e}")
         except Exception as e:
-            self.logger.error(f"Unexpected error loading queue: {e}")
\ No newline at end of file
+            self.logger.error(f"Unexpected error migrating queue backup: {e}")
@@ -1,26 +1,31 @@
 import logging
 import time
 import threading
-from typing import List, Union, Callable, Dict
+from typing import List, Union, Callable, Dict, Tuple
+from app_utils.metrics import REGISTRY, MetricsRegistry
+
+THREAD_RESTARTS = REGISTRY.counter("facp_thread_restarts_total", "Worker threads restarted after dying", ["thread"])
 
 class ThreadManager:
     def __init__(self):
         self.threads: Dict[str, threading.Thread] = {}
         self.shutdown_flags: Dict[str, threading.Event] = {}
+        self.wakeups: Dict[str, Callable] = {}
         self.logger: logging.Logger = logging.getLogger(__name__)
 
-    def start_threads(self, thread_configs: List[Union[threading.Thread, Callable]]):
+    def start_threads(self, thread_configs: List[Union[threading.Thread, Callable, Tuple[str, Callable]]]):
         for config in thread_configs:
             self.start_thread(config)
 
-    def start_thread(self, thread_config: Union[threading.Thread, Callable]):
+    def start_thread(self, thread_config: Union[threading.Thread, Callable, Tuple[str, Callable]]):
         if isinstance(thread_config, threading.Thread):
             thread = thread_config
             thread_name = thread.name
         else:
-            thread_name = thread_config.__name__
+            # A (name, callable) pair runs several instances of the same method under distinct names
+            thread_name, target = thread_config if isinstance(thread_config, tuple) else (thread_config.__name__, thread_config)
             shutdown_flag = threading.Event()
-            thread = threading.Thread(target=thread_config, args=(shutdown_flag,), name=thread_name)
+            thread = threading.Thread(target=target, args=(shutdown_flag,), name=thread_name)
             self.shutdown_flags[thread_name] = shutdown_flag
 
         if thread_name in self.threads:
@@ -31,6 +36,13 @@ class ThreadManager:
             self.threads[thread_name] = thread
             self.logger.info(f"Started thread: {thread_name}")
 
+    def register_metrics(self, registry: MetricsRegistry):
+        registry.gauge("facp_threads_alive", "Worker threads currently running").set_function(
+            lambda: sum(1 for thread in list(self.threads.values()) if thread.is_alive()))
+
+    def register_wakeup(self, thread_name: str, wakeup: Callable):
+        self.wakeups[thread_name] = wakeup
+
     def restart_thread(self, thread_name: str, new_thread: threading.Thread):
         self.stop_thread(thread_name)
         
@@ -49,6 +61,8 @@ class ThreadManager:
             if thread.is_alive():
                 self.logger.info(f"Stopping thread: {thread_name}")
                 self.shutdown_flags[thread_name].set()
+                if thread_name in self.wakeups:
+                    self.wakeups[thread_name]()
                 thread.join(timeout=5)
                 if thread.is_alive():
                     self.logger.warning(f"Thread {thread_name} did not stop gracefully.")
@@ -64,5 +78,6 @@ class ThreadManager:
             for thread_name, thread in list(self.threads.items()):
                 if not thread.is_alive():
                     self.logger.error(f"Thread {thread_name} has died. Attempting to restart.")
+                    THREAD_RESTARTS.labels(thread_name).inc()
                     self.restart_thread(thread_name, thread)
             time.sleep(5)
\ No newline at end of file
@@ -10,5 +10,5 @@ def load_and_validate_config(config_path: str) -> ConfigSchema:
     config_data = load_yaml(config_path)
     return ConfigSchema(**config_data)
 
-def load_event_severity_levels(file_path: str) -> Dict[int, Dict[str, int]]:
+def load_event_severity_levels(file_path: str) -> Dict[Any, Dict[str, Any]]:
     return load_yaml(file_path)
\ No newline at end of file
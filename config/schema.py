@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal
 
 class ThingsboardConfig(BaseModel):
     device_token: str
@@ -7,6 +8,18 @@ class ThingsboardConfig(BaseModel):
 
 class SerialConfig(BaseModel):
     puerto: str
+    reader_mode: Literal["select", "polling"] = "select"
+    # Raw bytes read from the port are also recorded here, with timestamps, for offline replay
+    capture_path: str | None = None
+    capture_max_bytes: int = 10 * 1024 * 1024
+    capture_backup_count: int = 3
+
+class PanelConfig(BaseModel):
+    id_modelo_panel: int
+    serial: SerialConfig
+    # ThingsBoard device the panel is published as through the gateway API, None = the connecting device itself
+    device_name: str | None = None
+    device_type: str = "FACP"
 
 class RelayConfig(BaseModel):
     pin: int
@@ -19,10 +32,83 @@ class RelayMonitorConfig(BaseModel):
     publish_interval: int
     alarm_active_high: bool
     trouble_active_high: bool
+    mode: Literal["edge", "polling"] = "edge"
+    debounce_ms: int = 50
+    heartbeat_interval: int = 300
+
+class EventCoalescingConfig(BaseModel):
+    window: float = 30
+    max_keys: int = 1024
+
+class ReportConfig(BaseModel):
+    chunk_rows: int = 200
+    compression_level: int = 6
+
+class RuntimeConfig(BaseModel):
+    mode: Literal["threads", "asyncio"] = "threads"
+
+class MetricsConfig(BaseModel):
+    http_enabled: bool = False
+    host: str = "127.0.0.1"
+    port: int = 9108
+    telemetry_interval: float = 0
+
+class GpioConfig(BaseModel):
+    backend: Literal["auto", "rpi", "gpiod", "simulated"] = "auto"
+    chip: str = "/dev/gpiochip0"
+
+class MqttConfig(BaseModel):
+    batch_size: int = 100
+    batch_linger: float = 0.05
+    reconnect_min_delay: float = 1
+    reconnect_max_delay: float = 60
+    rate_limits: str = "100:1,3000:60,7000:3600"
+    delta_state_telemetry: bool = False
+    compress_min_bytes: int = 0
+    # zlib levels, -1 is the zlib default
+    compression_level: int = Field(6, ge=-1, le=9)
+    # Unconfirmed QoS1 publishes allowed at once, 0 = a queued message is done once the publish call returns
+    inflight_window: int = 0
+    inflight_timeout: float = 30
+
+class QueueConfig(BaseModel):
+    max_bytes: int = 0
+    overflow_policy: Literal["drop_oldest", "coalesce", "spill"] = "drop_oldest"
+    spill_path: str = "queue_spill.bin"
 
 class ConfigSchema(BaseModel):
     thingsboard: ThingsboardConfig
-    serial: SerialConfig
+    mqtt: MqttConfig = MqttConfig()
+    queue: QueueConfig = QueueConfig()
+    serial: SerialConfig | None = None
     relay: RelayConfig
     relay_monitor: RelayMonitorConfig
-    id_modelo_panel: int
\ No newline at end of file
+    gpio: GpioConfig = GpioConfig()
+    coalescing: EventCoalescingConfig = EventCoalescingConfig()
+    report: ReportConfig = ReportConfig()
+    runtime: RuntimeConfig = RuntimeConfig()
+    metrics: MetricsConfig = MetricsConfig()
+    id_modelo_panel: int | None = None
+    panels: List[PanelConfig] = []
+
+    @model_validator(mode="after")
+    def check_panels(self) -> "ConfigSchema":
+        if not self.panels:
+            if self.serial is None or self.id_modelo_panel is None:
+                raise ValueError("Either 'panels' or both 'serial' and 'id_modelo_panel' must be configured")
+            return self
+        names = [panel.device_name for panel in self.panels]
+        if not all(names):
+            raise ValueError("Every entry in 'panels' needs a device_name")
+        if len(set(names)) != len(names):
+            raise ValueError("Panel device names must be unique")
+        return self
+
+    def panel_configs(self) -> List[PanelConfig]:
+        if self.panels:
+            return self.panels
+        return [PanelConfig(id_modelo_panel=self.id_modelo_panel, serial=self.serial)]
+
+    @property
+    def gateway_mode(self) -> bool:
+        return bool(self.panels)
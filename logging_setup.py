@@ -1,21 +1,138 @@
 import logging
 import logging.config
+import logging.handlers
+import queue
+import threading
+import time
 import yaml
 import os
+from collections import deque
+from typing import Any, Dict, List, Tuple
+
+class RateLimitFilter(logging.Filter):
+    # Lets the first of a repeated message through, then at most one per interval per logger and message
+    # template, reporting how many were suppressed in between. Errors and above are never limited.
+    def __init__(self, interval: float = 60, max_keys: int = 1024):
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self.windows: Dict[Tuple[str, Any], List[float]] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.WARNING or self.interval <= 0:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None:
+                if len(self.windows) >= self.max_keys:
+                    self.windows.clear()
+                self.windows[key] = [now, 0]
+                return True
+            if now - window[0] < self.interval:
+                window[1] += 1
+                return False
+            suppressed = window[1]
+            self.windows[key] = [now, 0]
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    # Never blocks the caller: a full queue drops the record. Records stay in this process, so exc_info is
+    # passed as it is and the traceback is formatted on the listener thread.
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only records that passed the level check and filters get here. The message is rendered now, once,
+        # because callers keep mutating the objects they log (e.g. an event dict queued right after)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class RingBufferHandler(logging.Handler):
+    # Keeps the last records in memory, e.g. to look at what happened before a failure without the SD card log
+    def __init__(self, capacity: int = 1000):
+        super().__init__()
+        self.records: deque = deque(maxlen=capacity)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.records.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def lines(self) -> List[str]:
+        return list(self.records)
+
+_listener: logging.handlers.QueueListener | None = None
+_handlers: List[logging.Handler] = []
+_queue_handler: NonBlockingQueueHandler | None = None
+_ring: RingBufferHandler | None = None
 
 def setup_logging(config_path: str) -> None:
+    queue_logging: Dict[str, Any] = {}
     if os.path.exists(config_path):
         with open(config_path, 'r') as f:
             config = yaml.safe_load(f)
+        queue_logging = config.pop('queue_logging', None) or {}
         logging.config.dictConfig(config)
         print(f"Logging configuration loaded from {config_path}")
     else:
-        logging.basicConfig(level=logging.DEBUG,
+        logging.basicConfig(level=logging.INFO,
                             format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
                             handlers=[
                                 logging.StreamHandler(),
                                 logging.FileHandler("app.log")
                             ])
         print(f"Logging configuration file not found at {config_path}. Using basic configuration.")
-    
-    logging.getLogger().setLevel(logging.DEBUG)
\ No newline at end of file
+
+    if queue_logging.get('enabled', False):
+        _start_queue_logging(queue_logging)
+
+def _start_queue_logging(options: Dict[str, Any]) -> None:
+    global _listener, _queue_handler, _ring, _handlers
+    root = logging.getLogger()
+    _handlers = list(root.handlers)
+    _ring = RingBufferHandler(options.get('ring_size', 1000))
+    if _handlers:
+        _ring.setFormatter(_handlers[0].formatter)
+
+    # The file and console handlers now run on the listener thread, callers only pay for a queue put
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(options.get('queue_size', 10000)))
+    _queue_handler.addFilter(RateLimitFilter(options.get('rate_limit_interval', 60)))
+    for handler in _handlers:
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *_handlers, _ring, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging() -> None:
+    # Flushes whatever is still queued to the file and console handlers
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        # Anything logged from here on is written directly
+        root = logging.getLogger()
+        root.removeHandler(_queue_handler)
+        for handler in _handlers:
+            root.addHandler(handler)
+        if _queue_handler is not None and _queue_handler.dropped:
+            logging.getLogger(__name__).warning(f"{_queue_handler.dropped} log records were dropped because the log queue was full")
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+def recent_log_lines() -> List[str]:
+    return _ring.lines() if _ring is not None else []
@@ -1,9 +1,27 @@
 import os
+import argparse
 from config.loader import load_and_validate_config, load_event_severity_levels
-from logging_setup import setup_logging
+from logging_setup import setup_logging, stop_logging
 from app.core import Application
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="FACP serial reader to ThingsBoard")
+    parser.add_argument("--replay", nargs="+", metavar="CAPTURE",
+                        help="Feed serial capture files (oldest first) through a panel handler instead of running the gateway")
+    parser.add_argument("--panel", help="Panel model id or handler class for --replay, defaults to the configured panel")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed factor, 0 = as fast as possible")
+    parser.add_argument("--show-events", action="store_true", help="Print every message the replay queues")
+    return parser.parse_args()
+
+def replay(args, config, event_severity_levels):
+    from app.replay import panel_model, replay_capture
+    model = panel_model(args.panel) if args.panel else config.panel_configs()[0].id_modelo_panel
+    result = replay_capture(config, event_severity_levels, args.replay, model, args.speed, args.show_events)
+    print("  ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}" for key, value in result.items()))
+
 def main():
+    args = parse_args()
+
     # Get the directory of the current script
     current_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -15,9 +33,23 @@ def main():
     config = load_and_validate_config(os.path.join(current_dir, "config", "config.yml"))
     event_severity_levels = load_event_severity_levels(os.path.join(current_dir, "config", "eventSeverityLevels.yml"))
 
+    if args.replay:
+        try:
+            replay(args, config, event_severity_levels)
+        finally:
+            stop_logging()
+        return
+
     # Initialize and run the application
-    app = Application(config, event_severity_levels)
-    app.start()
+    app_class = Application
+    if config.runtime.mode == "asyncio":
+        from app.async_runtime import AsyncApplication
+        app_class = AsyncApplication
+    app = app_class(config, event_severity_levels)
+    try:
+        app.start()
+    finally:
+        stop_logging()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file